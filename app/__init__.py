@@ -1,21 +1,34 @@
 # file: app/__init__.py
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
 from flask_login import LoginManager # Импорт LoginManager
-from flask_bcrypt import Bcrypt # Импорт Bcrypt (опционально, если используете)
+from app.ratelimit import RateLimiter # Ограничение частоты запросов
+from app.shared import SharedState # Общее состояние воркеров: кэш, сессии, блокировки
+from app.metrics import Metrics # Метрики для Prometheus (/metrics)
 # --- Важно импортировать Config ДО его использования ---
 from config import Config
 from datetime import datetime, timezone
-import os # Добавлен для отладки
+from sqlalchemy import MetaData, event
+from sqlalchemy.engine import Engine
+import sqlite3
 
 # --- Инициализация расширений ---
-db = SQLAlchemy()
-migrate = Migrate()
+# Имена ограничений задаются явно: Alembic (flask db) должен уметь их изменять и удалять,
+# в том числе в режиме batch для SQLite
+db = SQLAlchemy(metadata=MetaData(naming_convention={
+    'ix': 'ix_%(column_0_label)s',
+    'uq': 'uq_%(table_name)s_%(column_0_name)s',
+    'ck': 'ck_%(table_name)s_%(constraint_name)s',
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s',
+    'pk': 'pk_%(table_name)s',
+}))
 csrf = CSRFProtect()
 login_manager = LoginManager() # Создаем экземпляр LoginManager
-bcrypt = Bcrypt() # Создаем экземпляр Bcrypt (опционально)
+shared = SharedState()
+limiter = RateLimiter()
+metrics = Metrics()
 
 # --- Настройки Flask-Login ---
 # Указываем Flask-Login, где находится view-функция для входа
@@ -25,28 +38,41 @@ login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Пожалуйста, войдите, чтобы получить доступ к этой странице.'
 login_manager.login_message_category = 'info' # Категория для flash сообщения
 
+# --- Внешние ключи в SQLite ---
+# По умолчанию SQLite игнорирует ondelete='CASCADE'/'SET NULL' из app/models.py.
+# Удаление пользователей, блокнотов и заметок полагается на каскады БД (passive_deletes),
+# поэтому включаем проверку внешних ключей для каждого нового соединения.
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        # Действует только для еще пустой БД: новые файлы создаются с инкрементальным VACUUM
+        # (см. `flask maintenance vacuum`), для существующих это ничего не меняет
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        cursor.close()
+
 # --- Фабрика приложения ---
 def create_app(config_class=Config):
     app = Flask(__name__)
 
-    # --- Отладочная информация о SECRET_KEY ---
-    print("-" * 40)
-    print(f"--- [create_app] Initial app.config['SECRET_KEY'] (before from_object): {app.config.get('SECRET_KEY')}")
     # Загружаем конфигурацию из объекта Config
     app.config.from_object(config_class)
-    # Проверяем ключ СРАЗУ ПОСЛЕ загрузки из объекта
-    print(f"--- [create_app] app.config['SECRET_KEY'] AFTER from_object: {app.config.get('SECRET_KEY')}")
-    # Дополнительно проверим ключ прямо из os.environ на этом этапе
-    print(f"--- [create_app] os.environ.get('SECRET_KEY') at this point: {os.environ.get('SECRET_KEY')}")
-    print("-" * 40)
-    # --- Конец отладочной информации ---
+    if app.config['SECRET_KEY'] == 'you-will-never-guess':
+        app.logger.warning('SECRET_KEY не задан, используется значение по умолчанию')
+    # За обратным прокси: request.remote_addr, схема и хост - из X-Forwarded-* (rate limit, /metrics, url_for)
+    hops = app.config.get('PROXY_FIX_HOPS', 0)
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
 
     # --- Инициализация расширений с приложением ---
     db.init_app(app)
-    migrate.init_app(app, db)
+    # Flask-Migrate не инициализируется здесь: alembic подгружается только для `flask db` (см. app/cli.py)
     csrf.init_app(app) # CSRF должен быть инициализирован ПОСЛЕ установки SECRET_KEY
     login_manager.init_app(app) # Инициализируем LoginManager
-    bcrypt.init_app(app) # Инициализируем Bcrypt (опционально)
+    shared.init_app(app) # До limiter: RATELIMIT_STORAGE_URL='shared://' использует его бэкенд
+    limiter.init_app(app)
+    metrics.init_app(app) # После db: подписывается на события движка БД
 
     # --- Контекстный процессор для шаблонов ---
     @app.context_processor
@@ -62,6 +88,25 @@ def create_app(config_class=Config):
     from app.auth import bp as auth_bp # Регистрируем новый Blueprint аутентификации
     app.register_blueprint(auth_bp, url_prefix='/auth') # Добавляем префикс /auth
 
+    from app.attachments import bp as attachments_bp # Вложения (загрузка и раздача файлов)
+    app.register_blueprint(attachments_bp)
+
+    # --- CLI-команды обслуживания ---
+    from app.access import access_cli
+    from app.cli import migrate_cli, startup_report_command
+    from app.importers import import_notes_command
+    from app.links import links_cli
+    from app.maintenance import maintenance_cli, init_scheduler
+    from app.sections import sections_cli
+    app.cli.add_command(access_cli) # flask access rebuild
+    app.cli.add_command(links_cli) # flask links rebuild
+    app.cli.add_command(maintenance_cli) # flask maintenance gc|vacuum|analyze|check|sizes|run
+    app.cli.add_command(sections_cli) # flask sections rebuild
+    app.cli.add_command(migrate_cli) # flask db ... (лениво загружает Flask-Migrate)
+    app.cli.add_command(startup_report_command) # flask startup-report
+    app.cli.add_command(import_notes_command) # flask import-notes ФАЙЛ --user ИМЯ
+    init_scheduler(app) # Фоновое обслуживание БД, если MAINTENANCE_INTERVAL > 0
+
     # --- Контекст для Flask Shell ---
     # Импортируйте модели ПОСЛЕ определения 'db' и инициализации
     from app.models import User, Note, Tag, Notebook
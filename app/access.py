@@ -0,0 +1,80 @@
+# app/access.py
+"""Проекция доступа к заметкам (таблица note_access).
+
+Строка автора добавляется слушателем after_insert в app/models.py, а при
+удалении заметки или пользователя строки удаляет БД (ondelete='CASCADE').
+Изменения соавторства и массовые операции вызывают функции этого модуля
+в той же транзакции, что и основное изменение.
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, exists, insert, literal, select
+
+from app import db
+from app.models import Note, note_access, note_collaborators
+
+access_cli = AppGroup('access', help='Обслуживание проекции доступа к заметкам.')
+
+
+def accessible_notes(user_id):
+    """Запрос заметок, доступных пользователю (свои и общие)."""
+    return Note.query.join(note_access, note_access.c.note_id == Note.id)\
+        .filter(note_access.c.user_id == user_id)
+
+
+def can_read(note_id, user_id):
+    """Есть ли у пользователя доступ к заметке (автор или соавтор) - поиск по первичному ключу."""
+    return db.session.scalar(
+        select(note_access.c.is_owner).where(note_access.c.user_id == user_id, note_access.c.note_id == note_id)
+    ) is not None
+
+
+def accessible_note_ids(note_ids, user_id, owner_only=False):
+    """Возвращает множество id из note_ids, доступных пользователю, одним запросом."""
+    query = select(note_access.c.note_id).where(
+        note_access.c.user_id == user_id,
+        note_access.c.note_id.in_(note_ids)
+    )
+    if owner_only:
+        query = query.where(note_access.c.is_owner.is_(True))
+    return set(db.session.scalars(query))
+
+
+def grant(note_ids, user_id):
+    """Открывает соавтору доступ к заметкам (существующие строки не трогает)."""
+    rows = select(literal(user_id), Note.id, literal(False)).where(
+        Note.id.in_(note_ids),
+        ~exists().where(note_access.c.note_id == Note.id, note_access.c.user_id == user_id)
+    )
+    db.session.execute(insert(note_access).from_select(['user_id', 'note_id', 'is_owner'], rows))
+
+
+def revoke(note_ids, user_id):
+    """Отзывает доступ соавтора (доступ автора не затрагивается)."""
+    db.session.execute(delete(note_access).where(
+        note_access.c.note_id.in_(note_ids),
+        note_access.c.user_id == user_id,
+        note_access.c.is_owner.is_(False)
+    ))
+
+
+def rebuild():
+    """Полностью пересобирает проекцию из Note.user_id и note_collaborators."""
+    db.session.execute(delete(note_access))
+    db.session.execute(insert(note_access).from_select(
+        ['user_id', 'note_id', 'is_owner'],
+        select(Note.user_id, Note.id, literal(True))
+    ))
+    collaborators = select(note_collaborators.c.user_id, note_collaborators.c.note_id, literal(False))\
+        .join(Note, Note.id == note_collaborators.c.note_id)\
+        .where(note_collaborators.c.user_id != Note.user_id)
+    db.session.execute(insert(note_access).from_select(['user_id', 'note_id', 'is_owner'], collaborators))
+
+
+@access_cli.command('rebuild')
+def rebuild_command():
+    """Пересобирает note_access из заметок и соавторства (если проекция разошлась с ними)."""
+    rebuild()
+    db.session.commit()
+    total = db.session.scalar(select(db.func.count()).select_from(note_access))
+    click.echo(f'Проекция доступа пересобрана: {total} строк.')
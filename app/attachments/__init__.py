@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+bp = Blueprint('attachments', __name__)
+
+from app.attachments import routes
@@ -0,0 +1,107 @@
+import os
+
+from flask import abort, current_app, flash, redirect, send_file, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import select
+from werkzeug.utils import secure_filename
+
+from app import access, db
+from app.attachments import bp
+from app.attachments.storage import INLINE_MIMETYPES, AttachmentTooLarge, blob_path, markdown_link, release_blobs, store
+from app.forms import AttachmentForm
+from app.models import Attachment, Note
+
+
+@bp.route('/notes/<int:note_id>/attachments', methods=['POST'])
+@login_required
+def upload(note_id):
+    note = Note.query.get_or_404(note_id)
+    # Загружать могут автор и соавторы - те же правила, что и для редактирования
+    if not access.can_read(note.id, current_user.id):
+        abort(403)
+
+    form = AttachmentForm()
+    if form.validate_on_submit():
+        f = form.file.data
+        filename = secure_filename(f.filename) or 'file'
+        try:
+            sha256, size = store(f.stream, current_app.config['ATTACHMENT_MAX_SIZE'])
+        except AttachmentTooLarge:
+            max_mb = current_app.config['ATTACHMENT_MAX_SIZE'] // (1024 * 1024)
+            flash(f'Файл слишком большой (максимум {max_mb} МБ).', 'danger')
+            return redirect(url_for('main.view_note', note_id=note_id))
+
+        attachment = Attachment(note_id=note.id, user_id=current_user.id, sha256=sha256, filename=filename,
+                                mimetype=f.mimetype or 'application/octet-stream', size=size)
+        db.session.add(attachment)
+        try:
+            db.session.commit()
+            flash(f'Файл загружен. Вставьте в заметку: {markdown_link(attachment)}', 'success')
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Ошибка сохранения вложения для заметки {note_id}: {e}")
+            flash('Ошибка при загрузке файла.', 'danger')
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f"{getattr(form, field).label.text if hasattr(getattr(form, field), 'label') else field}: {error}", 'danger')
+
+    return redirect(url_for('main.view_note', note_id=note_id))
+
+
+# Без @login_required: вложения опубликованных заметок видны всем
+@bp.route('/attachments/<int:attachment_id>/<path:filename>')
+def serve(attachment_id, filename):
+    attachment = Attachment.query.get_or_404(attachment_id)
+    is_public = db.session.scalar(select(Note.is_public).where(Note.id == attachment.note_id))
+    if not is_public:
+        if not current_user.is_authenticated or not access.can_read(attachment.note_id, current_user.id):
+            abort(404) # Не раскрываем существование чужих вложений
+
+    path = blob_path(attachment.sha256)
+    if not os.path.exists(path):
+        current_app.logger.error(f"Файл вложения {attachment.id} ({attachment.sha256}) отсутствует на диске")
+        abort(404)
+
+    # Путь к файлу (а не поток) позволяет серверу использовать wsgi.file_wrapper/sendfile,
+    # conditional=True включает ответы 206 на Range и 304 на If-None-Match.
+    # Содержимое неизменно для хэша, поэтому ETag - сам SHA-256.
+    response = send_file(
+        path,
+        mimetype=attachment.mimetype,
+        download_name=attachment.filename,
+        as_attachment=attachment.mimetype not in INLINE_MIMETYPES,
+        conditional=True,
+        etag=attachment.sha256,
+        max_age=3600
+    )
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    if not is_public:
+        response.cache_control.public = False
+        response.cache_control.private = True
+    return response
+
+
+@bp.route('/attachments/<int:attachment_id>/delete', methods=['POST'])
+@login_required
+def delete(attachment_id):
+    attachment = Attachment.query.get_or_404(attachment_id)
+    note_id = attachment.note_id
+    # Удалять вложения может только автор заметки
+    if attachment.note.user_id != current_user.id:
+        abort(403)
+
+    sha256 = attachment.sha256
+    db.session.delete(attachment)
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ошибка удаления вложения {attachment_id}: {e}")
+        flash('Ошибка при удалении вложения.', 'danger')
+    else:
+        # Файл общий для всех ссылок с тем же хэшем - удаляется, только если ссылок не осталось
+        release_blobs({sha256})
+        flash('Вложение удалено.', 'info')
+
+    return redirect(url_for('main.view_note', note_id=note_id)) # Не Referer: он может вести на чужой сайт
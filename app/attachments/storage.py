@@ -0,0 +1,171 @@
+# app/attachments/storage.py
+"""Хранилище вложений на диске с адресацией по содержимому.
+
+Файл хранится один раз под именем своего SHA-256 (ATTACHMENTS_DIR/ab/cd/<sha256>),
+поэтому одинаковые загрузки разных пользователей занимают место однократно.
+Строки Attachment в БД лишь ссылаются на хэш.
+
+Файл без ссылок удаляется (release_blobs, `flask maintenance gc`) только под
+общей блокировкой BLOB_LOCK, которую берет и store(), и только если его не
+трогали дольше BLOB_GRACE секунд: загрузка, дедуплицированная на этот файл,
+обновляет его mtime и успевает закоммитить свою строку Attachment.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+from flask import current_app, url_for
+from sqlalchemy import select
+
+from app import db, shared
+from app.models import Attachment
+
+CHUNK_SIZE = 64 * 1024
+# Эти типы безопасно отдавать inline, остальное - только как загрузку
+INLINE_MIMETYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf'}
+# Ссылки на вложения в Markdown: /attachments/<id>/<filename>
+ATTACHMENT_URL_RE = re.compile(r'/attachments/(\d+)/([^\s)"\']+)')
+BLOB_LOCK = 'attachments:blobs'
+BLOB_GRACE = 15 * 60 # Секунд после записи или дедупликации, в течение которых файл не удаляется
+
+
+class AttachmentTooLarge(Exception):
+    """Размер загрузки превышает ATTACHMENT_MAX_SIZE."""
+
+
+def blob_path(sha256):
+    """Путь к файлу с заданным хэшем."""
+    return os.path.join(current_app.config['ATTACHMENTS_DIR'], sha256[:2], sha256[2:4], sha256)
+
+
+@contextmanager
+def _blob_lock():
+    """Блокировка проверки и удаления файлов (см. app/shared.py; с 'memory://' - внутри процесса)."""
+    with shared.lock(BLOB_LOCK, ttl=30, wait=10) as acquired:
+        yield acquired
+
+
+def store(stream, max_size=None):
+    """Потоково сохраняет файл, считая SHA-256 на лету. Возвращает (sha256, size).
+
+    Если такой файл уже есть, новая копия отбрасывается (дедупликация).
+    """
+    root = current_app.config['ATTACHMENTS_DIR']
+    tmp_dir = os.path.join(root, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise AttachmentTooLarge(f"Файл больше {max_size} байт")
+                hasher.update(chunk)
+                out.write(chunk)
+        sha256 = hasher.hexdigest()
+        path = blob_path(sha256)
+        # Не получив блокировку, все равно сохраняем: свежий mtime защищает файл от удаления
+        with _blob_lock():
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                os.utime(path) # Строка Attachment еще не закоммичена - продлеваем BLOB_GRACE
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path) # Атомарно в пределах одной ФС
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return sha256, size
+
+
+def attachment_hashes(condition):
+    """Хэши файлов вложений, подходящих под условие.
+
+    Собираются до удаления заметок или вложений (каскад БД удаляет строки
+    Attachment), а после коммита передаются в release_blobs.
+    """
+    return set(db.session.scalars(select(Attachment.sha256).where(condition).distinct()))
+
+
+def release_blobs(sha256s, grace=BLOB_GRACE):
+    """Удаляет файлы хэшей, на которые не осталось ссылок. Возвращает число удаленных.
+
+    Вызывается после коммита удаления, поэтому не бросает исключений: ошибка
+    только логируется. Недавно записанные файлы, файлы, для которых не
+    удалось получить блокировку, и файлы, не удаленные из-за ошибки, остаются
+    на диске - их удалит `flask maintenance gc`.
+    """
+    sha256s = set(sha256s)
+    if not sha256s:
+        return 0
+    try:
+        return _release_blobs(sha256s, grace)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Не удалось освободить файлы вложений ({len(sha256s)} шт.): {e}")
+        return 0
+
+
+def _release_blobs(sha256s, grace):
+    removed = 0
+    with _blob_lock() as acquired:
+        if not acquired:
+            return 0
+        # Проверка ссылок под блокировкой: store() не может одновременно дедуплицировать на этот файл
+        referenced = set(db.session.scalars(select(Attachment.sha256).where(Attachment.sha256.in_(sha256s))))
+        deadline = time.time() - grace
+        for sha256 in sha256s - referenced:
+            path = blob_path(sha256)
+            try:
+                if os.stat(path).st_mtime > deadline:
+                    continue
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                current_app.logger.warning(f"Не удалось удалить файл вложения {sha256}: {e}")
+    return removed
+
+
+def markdown_link(attachment):
+    """Markdown-ссылка на вложение для вставки в заметку."""
+    url = url_for('attachments.serve', attachment_id=attachment.id, filename=attachment.filename)
+    prefix = '!' if attachment.mimetype.startswith('image/') else ''
+    return f'{prefix}[{attachment.filename}]({url})'
+
+
+def bundle(zip_file, note, content, folder='attachments'):
+    """Кладет вложения заметки в zip-архив и переписывает ссылки на относительные.
+
+    Возвращает содержимое заметки с исправленными ссылками.
+    """
+    attachments = {attachment.id: attachment for attachment in note.attachments}
+    used_names = set()
+    archive_names = {}
+    for attachment in attachments.values():
+        name = attachment.filename
+        if name in used_names: # Одинаковые имена внутри одной заметки
+            name = f'{attachment.id}_{name}'
+        path = blob_path(attachment.sha256)
+        if not os.path.exists(path): # Ссылка в тексте останется прежней
+            current_app.logger.error(f"Файл вложения {attachment.id} ({attachment.sha256}) отсутствует на диске")
+            continue
+        used_names.add(name)
+        archive_names[attachment.id] = f'{folder}/{name}'
+        zip_file.write(path, archive_names[attachment.id])
+
+    def relative(match):
+        attachment_id = int(match.group(1))
+        return archive_names.get(attachment_id, match.group(0))
+
+    return ATTACHMENT_URL_RE.sub(relative, content)
@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
-from app.models import User
+from app.models import User, normalize_username
 
 class LoginForm(FlaskForm):
     username = StringField('Имя пользователя', validators=[DataRequired()])
@@ -26,11 +26,18 @@ class RegistrationForm(FlaskForm):
 
     # Кастомные валидаторы для проверки уникальности
     def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
+        # Без учета регистра: "Bob" и "bob" при шаринге - один и тот же пользователь
+        user = User.query.filter_by(username_lower=normalize_username(username.data)).first()
         if user:
             raise ValidationError('Это имя пользователя уже занято. Пожалуйста, выберите другое.')
 
     def validate_email(self, email):
         user = User.query.filter_by(email=email.data).first()
         if user:
-            raise ValidationError('Этот email уже зарегистрирован. Пожалуйста, используйте другой.')
\ No newline at end of file
+            raise ValidationError('Этот email уже зарегистрирован. Пожалуйста, используйте другой.')
+
+class DeleteAccountForm(FlaskForm):
+    password = PasswordField('Текущий пароль', validators=[DataRequired(message="Введите пароль для подтверждения.")])
+    confirm = BooleanField('Я понимаю, что все мои заметки и блокноты будут удалены безвозвратно',
+                           validators=[DataRequired(message="Подтвердите удаление аккаунта.")])
+    submit = SubmitField('Удалить аккаунт')
@@ -1,13 +1,18 @@
-from flask import render_template, flash, redirect, url_for, request
+from flask import render_template, flash, redirect, url_for, request, current_app
 from flask_login import login_user, logout_user, current_user, login_required
 from urllib.parse import urlsplit
-from app import db  # bcrypt (если используете)
+from sqlalchemy import delete, select
+from app import db, limiter
+from app.attachments.storage import attachment_hashes, release_blobs
 from app.auth import bp  # Импортируем Blueprint
-from app.auth.forms import LoginForm, RegistrationForm
-from app.models import User
+from app.auth.forms import LoginForm, RegistrationForm, DeleteAccountForm
+from app.models import Attachment, Note, User
+from app.ratelimit import by_form_field, by_ip
 
 
 @bp.route('/login', methods=['GET', 'POST'])
+@limiter.limit('10/minute', keys=(by_ip, by_form_field('username'))) # Подбор пароля: по IP и по логину
+@limiter.expensive # Проверка хэша пароля нагружает CPU
 def login():
     # Если пользователь уже вошел, перенаправляем на главную
     if current_user.is_authenticated:
@@ -37,6 +42,8 @@ def logout():
     return redirect(url_for('main.index'))
 
 @bp.route('/register', methods=['GET', 'POST'])
+@limiter.limit('10/hour', keys=(by_ip,))
+@limiter.expensive
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
@@ -48,4 +55,32 @@ def register():
         db.session.commit()
         flash('Поздравляем, вы успешно зарегистрированы! Теперь вы можете войти.', 'success')
         return redirect(url_for('auth.login'))
-    return render_template('auth/register.html', title='Регистрация', form=form)
\ No newline at end of file
+    return render_template('auth/register.html', title='Регистрация', form=form)
+
+@bp.route('/delete_account', methods=['GET', 'POST'])
+@login_required
+def delete_account():
+    form = DeleteAccountForm()
+    if form.validate_on_submit():
+        if not current_user.check_password(form.password.data):
+            flash('Неверный пароль.', 'danger')
+            return redirect(url_for('auth.delete_account'))
+        user_id = current_user.id
+        try:
+            # Вложения в заметках пользователя (загруженные им в чужие заметки остаются у владельцев)
+            hashes = attachment_hashes(Attachment.note_id.in_(select(Note.id).where(Note.user_id == user_id)))
+            # Один DELETE: заметки, блокноты, теги заметок, соавторство, проекцию доступа и вложения
+            # его заметок удаляет сама БД по ondelete='CASCADE' (у чужих вложений - SET NULL),
+            # без загрузки дочерних объектов в ORM
+            db.session.execute(delete(User).where(User.id == user_id))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Ошибка удаления аккаунта {user_id}: {e}")
+            flash('Не удалось удалить аккаунт из-за ошибки.', 'danger')
+            return redirect(url_for('auth.delete_account'))
+        logout_user()
+        release_blobs(hashes) # Аккаунт уже удален: ошибка с файлами только логируется
+        flash('Ваш аккаунт и все данные удалены.', 'info')
+        return redirect(url_for('auth.login'))
+    return render_template('auth/delete_account.html', title='Удаление аккаунта', form=form)
@@ -0,0 +1,130 @@
+# app/autocomplete.py
+"""Автодополнение тегов и имен пользователей.
+
+Поиск по префиксу идет диапазоном [prefix, следующий_префикс) по индексам
+ix_tag_name (имена тегов хранятся в нижнем регистре) и User.username_lower,
+а не через LIKE/ILIKE. Результаты кэшируются в памяти процесса (LRU с TTL);
+если для более короткого префикса в кэше лежит полный ответ (меньше limit
+строк), более длинный префикс фильтруется из него без запроса к БД.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+
+from app import db, metrics
+from app.models import Tag, User, normalize_username, note_access, note_tags
+
+SUGGESTION_LIMIT = 10
+PREFIX_MAX_LENGTH = 64
+
+
+class PrefixCache:
+    """LRU-кэш ответов по префиксу с ограниченным временем жизни."""
+
+    def __init__(self, name, max_entries=2048, ttl=30):
+        self.name = name # Метка cache в метрике cache_requests_total
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope, prefix, limit, key=lambda item: item):
+        """Ответ для префикса или None. key извлекает строку из элемента ответа."""
+        items = self._lookup(scope, prefix, limit, key)
+        metrics.cache.inc(self.name, 'miss' if items is None else 'hit')
+        return items
+
+    def _lookup(self, scope, prefix, limit, key):
+        now = time.monotonic()
+        with self._lock:
+            for length in range(len(prefix), -1, -1):
+                entry = self._entries.get((scope, prefix[:length]))
+                if entry is None:
+                    continue
+                expires, items = entry
+                if expires < now:
+                    del self._entries[(scope, prefix[:length])]
+                    continue
+                if length == len(prefix):
+                    self._entries.move_to_end((scope, prefix))
+                    return items
+                if len(items) < limit: # Полный ответ для короткого префикса покрывает длинный
+                    return [item for item in items if key(item).startswith(prefix)]
+                return None
+        return None
+
+    def set(self, scope, prefix, items):
+        with self._lock:
+            self._entries[(scope, prefix)] = (time.monotonic() + self.ttl, items)
+            self._entries.move_to_end((scope, prefix))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = PrefixCache('autocomplete')
+
+
+def normalize(text):
+    return (text or '').strip().lower()[:PREFIX_MAX_LENGTH]
+
+
+def prefix_range(column, prefix):
+    """Условие column LIKE 'prefix%' в виде диапазона, пригодного для индекса."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return (column >= prefix) & (column < upper)
+
+
+def suggest_tags(user_id, prefix, limit=SUGGESTION_LIMIT):
+    """Теги доступных пользователю заметок по префиксу; сначала самые используемые."""
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    scope = f'tags:{user_id}'
+    cached = cache.get(scope, prefix, limit)
+    if cached is not None:
+        return cached[:limit]
+
+    usage = func.count(note_access.c.note_id)
+    rows = db.session.execute(
+        select(Tag.name, usage)
+        .join(note_tags, note_tags.c.tag_id == Tag.id)
+        .join(note_access, note_access.c.note_id == note_tags.c.note_id)
+        .where(prefix_range(Tag.name, prefix), note_access.c.user_id == user_id)
+        .group_by(Tag.id, Tag.name)
+        .order_by(usage.desc(), Tag.name)
+        .limit(limit)
+    ).all()
+    names = [name for name, _ in rows]
+    cache.set(scope, prefix, names)
+    return names
+
+
+def suggest_usernames(prefix, exclude=None, limit=SUGGESTION_LIMIT):
+    """Имена пользователей по префиксу (без учета регистра), по алфавиту; exclude - свое имя."""
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    cached = cache.get('users', prefix, limit + 1, key=str.lower)
+    if cached is None:
+        # limit + 1: запас на исключение самого пользователя
+        cached = list(db.session.scalars(
+            select(User.username)
+            .where(prefix_range(User.username_lower, prefix))
+            .order_by(User.username_lower)
+            .limit(limit + 1)
+        ))
+        cache.set('users', prefix, cached)
+    return [name for name in cached if name != exclude][:limit]
+
+
+def find_user(username):
+    """Пользователь по имени без учета регистра - точный поиск по индексу username_lower."""
+    key = normalize_username(username)
+    return User.query.filter(User.username_lower == key).first() if key else None
+
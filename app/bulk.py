@@ -0,0 +1,85 @@
+# app/bulk.py
+"""Массовые операции над заметками.
+
+Каждая функция работает с набором id заметок и выполняет одну set-based
+инструкцию (UPDATE/INSERT ... SELECT/DELETE) вместо загрузки и изменения
+заметок по одной. Коммит выполняет вызывающий код, поэтому вся пачка
+операций укладывается в одну транзакцию.
+"""
+from sqlalchemy import and_, delete, exists, insert, literal, select, true, update
+
+from app import access, db
+from app.models import Note, Tag, note_collaborators, note_tags
+
+BULK_MAX_NOTES = 1000  # Ограничение на размер пачки за один запрос
+
+
+def move_notes(note_ids, notebook_id):
+    """Переносит заметки в блокнот (notebook_id=None - убрать из блокнота)."""
+    result = db.session.execute(
+        update(Note).where(Note.id.in_(note_ids)).values(notebook_id=notebook_id),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount
+
+
+def add_tags(note_ids, tag_ids):
+    """Привязывает теги к заметкам, пропуская уже существующие связи."""
+    if not tag_ids:
+        return 0
+    # Декартово произведение выбранных заметок и тегов - намеренное
+    pairs = select(Note.id, Tag.id).join(Tag, true()).where(
+        Note.id.in_(note_ids),
+        Tag.id.in_(tag_ids),
+        ~exists().where(note_tags.c.note_id == Note.id, note_tags.c.tag_id == Tag.id)
+    )
+    result = db.session.execute(insert(note_tags).from_select(['note_id', 'tag_id'], pairs))
+    return result.rowcount
+
+
+def remove_tags(note_ids, tag_names):
+    """Отвязывает теги с указанными именами от заметок."""
+    if not tag_names:
+        return 0
+    tag_ids = select(Tag.id).where(Tag.name.in_(tag_names))
+    result = db.session.execute(
+        delete(note_tags).where(note_tags.c.note_id.in_(note_ids), note_tags.c.tag_id.in_(tag_ids))
+    )
+    return result.rowcount
+
+
+def share_notes(note_ids, user_id):
+    """Добавляет пользователя в соавторы заметок (кроме его собственных и уже расшаренных)."""
+    pairs = select(literal(user_id), Note.id).where(
+        Note.id.in_(note_ids),
+        Note.user_id != user_id,
+        ~exists().where(note_collaborators.c.note_id == Note.id, note_collaborators.c.user_id == user_id)
+    )
+    result = db.session.execute(insert(note_collaborators).from_select(['user_id', 'note_id'], pairs))
+    access.grant(note_ids, user_id)
+    return result.rowcount
+
+
+def unshare_notes(note_ids, user_id):
+    """Отзывает доступ пользователя к заметкам."""
+    result = db.session.execute(
+        delete(note_collaborators).where(and_(note_collaborators.c.note_id.in_(note_ids),
+                                              note_collaborators.c.user_id == user_id))
+    )
+    access.revoke(note_ids, user_id)
+    return result.rowcount
+
+
+def delete_notes(note_ids):
+    """Удаляет заметки одним DELETE.
+
+    Строки note_tags, note_collaborators, note_access и attachment удаляет сама БД
+    (ondelete='CASCADE'; для SQLite внешние ключи включаются в app/__init__.py).
+    Файлы вложений остаются на диске: вызывающий код собирает их хэши до
+    удаления (attachment_hashes) и после коммита передает в release_blobs.
+    """
+    result = db.session.execute(
+        delete(Note).where(Note.id.in_(note_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount
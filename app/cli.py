@@ -0,0 +1,123 @@
+# app/cli.py
+"""CLI-команды, не нужные веб-воркеру.
+
+Flask-Migrate (а с ним alembic) импортируется только при вызове `flask db ...`:
+группа MigrateGroup подменяет себя настоящей группой Flask-Migrate при
+первом обращении к ее командам.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import click
+from flask import current_app, g
+from flask.cli import with_appcontext
+
+
+@with_appcontext
+def _migrate_options(directory, x_arg):
+    # То же, что делает сама группа `db` Flask-Migrate: подкоманды читают опции из g
+    g.directory = directory
+    g.x_arg = x_arg
+
+
+class MigrateGroup(click.Group):
+    """Ленивая обертка над `flask db` с теми же опциями группы (-d, -x)."""
+
+    def __init__(self, name, **kwargs):
+        params = [
+            click.Option(['-d', '--directory'], default=None, help='Каталог миграций (по умолчанию "migrations").'),
+            click.Option(['-x', '--x-arg'], multiple=True, help='Дополнительные аргументы для env.py.'),
+        ]
+        super().__init__(name, params=params, callback=_migrate_options, **kwargs)
+
+    def _load(self):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as db_group
+        app = current_app._get_current_object()
+        if 'migrate' not in app.extensions:
+            from app import db
+            # batch: SQLite не умеет ALTER для большинства изменений, Alembic пересоздает таблицу
+            Migrate(app, db, render_as_batch=True, compare_type=True)
+        return db_group
+
+    def list_commands(self, ctx):
+        return self._load().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._load().get_command(ctx, name)
+
+
+migrate_cli = MigrateGroup('db', help='Миграции БД (Flask-Migrate/Alembic).')
+
+
+# Скрипт замера выполняется в отдельном процессе, чтобы импорты были холодными
+_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+application = app.create_app()
+t2 = time.perf_counter()
+with application.app_context():
+    from app.rendering import render_markdown
+    render_markdown('# probe')
+t3 = time.perf_counter()
+print(json.dumps({'import_app': t1 - t0, 'create_app': t2 - t1, 'first_render': t3 - t2}))
+"""
+
+
+def _parse_importtime(stderr):
+    """Разбирает вывод -X importtime в список (модуль, собственное время, суммарное время) в мкс."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+@click.command('startup-report')
+@click.option('--top', default=15, show_default=True, help='Сколько самых дорогих импортов показать.')
+@click.option('--json', 'as_json', is_flag=True, help='Вывод в JSON (для CI).')
+@click.option('--max-ms', type=float, default=None, help='Код возврата 1, если холодный старт дольше.')
+def startup_report_command(top, as_json, max_ms):
+    """Замеряет холодный старт: импорт пакета, create_app и первый рендер."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE],
+        capture_output=True, text=True, cwd=os.path.dirname(current_app.root_path)
+    )
+    if result.returncode != 0:
+        raise click.ClickException(f'Замер не удался:\n{result.stderr[-2000:]}')
+
+    phases = {name: round(seconds * 1000, 1) for name, seconds in json.loads(result.stdout.strip().splitlines()[-1]).items()}
+    total_ms = round(phases['import_app'] + phases['create_app'], 1)
+    # Группируем по пакетам (для самого приложения - по подпакетам app.*): самое дорогое
+    # вхождение пакета - это его внешний импорт, вложенные уже входят в него
+    packages = {}
+    for name, _, cumulative in _parse_importtime(result.stderr):
+        parts = name.split('.')
+        package = '.'.join(parts[:2]) if parts[0] == 'app' else parts[0]
+        if package != 'app':
+            packages[package] = max(packages.get(package, 0), cumulative)
+    top_level = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    if as_json:
+        click.echo(json.dumps({
+            'phases_ms': phases,
+            'startup_ms': total_ms,
+            'imports_ms': {name: round(cumulative / 1000, 1) for name, cumulative in top_level},
+        }, ensure_ascii=False))
+    else:
+        click.echo('Фазы (мс):')
+        for name, ms in phases.items():
+            click.echo(f'  {name:<14} {ms:>8.1f}')
+        click.echo(f'  {"startup":<14} {total_ms:>8.1f}')
+        click.echo('Самые дорогие импорты (суммарно, мс):')
+        for name, cumulative in top_level:
+            click.echo(f'  {name:<30} {cumulative / 1000:>8.1f}')
+
+    if max_ms is not None and total_ms > max_ms:
+        raise click.ClickException(f'Холодный старт {total_ms} мс превышает порог {max_ms} мс')
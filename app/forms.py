@@ -5,6 +5,8 @@ from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, TextAreaField, SubmitField, SelectField, PasswordField, BooleanField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from app.models import User, Notebook, Note # Добавил Note для примера, но он не нужен будет в валидаторе ShareNoteForm
+from app.autocomplete import find_user
+from app.importers import extensions as import_extensions
 from flask_login import current_user
 from flask import request # Импортируем request
 from flask_login import current_user
@@ -18,7 +20,7 @@ class ShareNoteForm(FlaskForm):
 
     # Валидатор для проверки существования пользователя и других условий
     def validate_username(self, username_field):
-        user_to_share = User.query.filter(User.username.ilike(username_field.data)).first() # Регистронезависимый поиск
+        user_to_share = find_user(username_field.data) # Регистронезависимый поиск по индексу
 
         if not user_to_share:
             raise ValidationError(f'Пользователь "{username_field.data}" не найден.')
@@ -89,8 +91,50 @@ class NoteForm(FlaskForm):
 
 # --- Форма для импорта ---
 class ImportForm(FlaskForm):
-    md_file = FileField('Markdown файл (.md)', validators=[
+    file = FileField('Файл', validators=[
         FileRequired(message="Выберите файл для импорта."),
-        FileAllowed(['md', 'markdown', 'txt'], 'Разрешены только текстовые файлы Markdown (.md, .markdown, .txt)!')
+        FileAllowed(import_extensions(), 'Поддерживаются Markdown, HTML, Evernote (.enex) и архив Obsidian (.zip).')
     ])
-    submit = SubmitField('Импортировать')
\ No newline at end of file
+    notebook = SelectField('Блокнот для заметок без блокнота', coerce=int)
+    submit = SubmitField('Импортировать')
+
+    def __init__(self, *args, **kwargs):
+        super(ImportForm, self).__init__(*args, **kwargs)
+        if current_user.is_authenticated:
+            notebook_choices = [(nb.id, nb.name) for nb in Notebook.query.filter_by(user_id=current_user.id).order_by('name').all()]
+        else:
+            notebook_choices = []
+        self.notebook.choices = [(-1, '-- Без блокнота --')] + notebook_choices
+        if self.notebook.data is None:
+            self.notebook.data = -1
+
+# --- Форма массовых операций над заметками ---
+class BulkNoteForm(FlaskForm):
+    action = SelectField('Действие', choices=[
+        ('move', 'Переместить в блокнот'),
+        ('tag_add', 'Добавить теги'),
+        ('tag_remove', 'Убрать теги'),
+        ('share', 'Поделиться'),
+        ('unshare', 'Отозвать доступ'),
+        ('delete', 'Удалить'),
+    ])
+    notebook = SelectField('Блокнот', coerce=int)
+    tags = StringField('Теги (через запятую)', validators=[Length(max=255)])
+    username = StringField('Имя пользователя', validators=[Length(max=64)])
+    submit = SubmitField('Применить')
+
+    def __init__(self, *args, **kwargs):
+        super(BulkNoteForm, self).__init__(*args, **kwargs)
+        if current_user.is_authenticated:
+            notebook_choices = [(nb.id, nb.name) for nb in Notebook.query.filter_by(user_id=current_user.id).order_by('name').all()]
+        else:
+            notebook_choices = []
+        self.notebook.choices = [(-1, '-- Без блокнота --')] + notebook_choices
+        if self.notebook.data is None:
+            self.notebook.data = -1
+
+
+# --- Форма загрузки вложения ---
+class AttachmentForm(FlaskForm):
+    file = FileField('Файл', validators=[FileRequired(message="Выберите файл для загрузки.")])
+    submit = SubmitField('Загрузить')
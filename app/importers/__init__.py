@@ -0,0 +1,200 @@
+# app/importers/__init__.py
+"""Импорт заметок из других форматов.
+
+Обработчики форматов (app/importers/formats.py) превращают файл в поток
+ImportedNote, а import_notes сохраняет его пачками: теги и блокноты
+сопоставляются с существующими Tag/Notebook по имени (недостающие
+создаются), каждая пачка - одна транзакция, после нее вызывается
+progress(число импортированных). Большие экспорты удобнее загружать
+командой `flask import-notes`.
+"""
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+
+from app import db, links, sections
+from app.importers.formats import HANDLERS, ImportedNote, ImportFormatError
+from app.models import Note, Notebook, Tag, User, note_tags
+
+# ImportedNote - тип, который должен отдавать parse() подключаемого через register() обработчика
+__all__ = ['HANDLERS', 'ImportFormatError', 'ImportStats', 'ImportedNote', 'extensions', 'handler_for',
+           'import_notes', 'import_notes_command', 'register']
+
+IMPORT_BATCH_SIZE = 200
+TAG_MAX_LENGTH = 64 # = длина Tag.name
+NOTEBOOK_MAX_LENGTH = 100 # = длина Notebook.name
+
+
+def register(handler):
+    """Подключает обработчик формата (объект с name, label, extensions и parse -> ImportedNote)."""
+    HANDLERS.append(handler)
+
+
+def extensions():
+    """Все расширения файлов, которые умеют разбирать обработчики."""
+    return sorted({ext for handler in HANDLERS for ext in handler.extensions})
+
+
+def handler_for(filename, name=None):
+    """Обработчик по имени формата или по расширению файла."""
+    if name:
+        for handler in HANDLERS:
+            if handler.name == name:
+                return handler
+        raise ImportFormatError(f'Неизвестный формат импорта: {name}')
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    for handler in HANDLERS:
+        if ext in handler.extensions:
+            return handler
+    raise ImportFormatError(f'Не удалось определить формат файла {filename}')
+
+
+class ImportStats:
+    def __init__(self):
+        self.notes = 0
+        self.tags = 0 # Созданные теги
+        self.notebooks = 0 # Созданные блокноты
+        self.last_note_id = None
+
+
+def _tag_name(name):
+    return name.replace(',', ' ').strip().lower()[:TAG_MAX_LENGTH]
+
+
+class _Importer:
+    """Сопоставление имен тегов и блокнотов с id; кэш живет одну операцию импорта."""
+
+    def __init__(self, user_id, notebook_id, stats):
+        self.user_id = user_id
+        self.notebook_id = notebook_id
+        self.stats = stats
+        self.tag_ids = {}
+        self.notebook_ids = dict(db.session.execute(
+            select(Notebook.name, Notebook.id).where(Notebook.user_id == user_id)
+        ).all())
+
+    def _resolve_tags(self, names):
+        if names:
+            Tag.mark_used(names) # И для закэшированных id: тег не должен исчезнуть до вставки note_tags
+        missing = [name for name in names if name not in self.tag_ids]
+        if missing:
+            self.tag_ids.update(db.session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(missing))).all())
+            created = [Tag(name=name) for name in missing if name not in self.tag_ids]
+            if created:
+                db.session.add_all(created)
+                db.session.flush()
+                self.tag_ids.update((tag.name, tag.id) for tag in created)
+                self.stats.tags += len(created)
+
+    def _notebook_id(self, name):
+        name = (name or '').strip()[:NOTEBOOK_MAX_LENGTH]
+        if not name:
+            return self.notebook_id
+        if name not in self.notebook_ids:
+            notebook = Notebook(name=name, user_id=self.user_id)
+            db.session.add(notebook)
+            db.session.flush()
+            self.notebook_ids[name] = notebook.id
+            self.stats.notebooks += 1
+        return self.notebook_ids[name]
+
+    def save_batch(self, batch):
+        """Сохраняет пачку ImportedNote одной транзакцией."""
+        tag_names = [sorted({_tag_name(tag) for tag in item.tags} - {''}) for item in batch]
+        self._resolve_tags({name for names in tag_names for name in names})
+        notes = []
+        for item in batch:
+            note = Note(title=item.title, content=item.content, user_id=self.user_id,
+                        notebook_id=self._notebook_id(item.notebook))
+            if item.created_at:
+                note.created_at = item.created_at
+            if item.updated_at:
+                note.updated_at = item.updated_at
+            notes.append(note)
+        db.session.add_all(notes)
+        db.session.flush()
+
+        rows = [{'note_id': note.id, 'tag_id': self.tag_ids[name]}
+                for note, names in zip(notes, tag_names) for name in names]
+        if rows:
+            db.session.execute(insert(note_tags), rows)
+        for note in notes:
+            if '[[' in note.content:
+                links.update_links(note)
+            sections.sync_sections(note)
+        links.retarget_new(notes) # Один UPDATE на пачку вместо двух на заметку
+        db.session.commit()
+        self.stats.notes += len(notes)
+        self.stats.last_note_id = notes[-1].id
+
+
+def import_notes(user_id, items, notebook_id=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Сохраняет заметки из итератора ImportedNote. Возвращает ImportStats.
+
+    notebook_id - блокнот для заметок, у которых в файле блокнота нет.
+    Уже сохраненные пачки остаются в БД, если разбор файла прервется ошибкой.
+    """
+    stats = ImportStats()
+    importer = _Importer(user_id, notebook_id, stats)
+    batch = []
+    try:
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                importer.save_batch(batch)
+                batch = []
+                if progress:
+                    progress(stats.notes)
+        if batch:
+            importer.save_batch(batch)
+            if progress:
+                progress(stats.notes)
+    except Exception:
+        db.session.rollback()
+        current_app.logger.error(f"Импорт прерван после {stats.notes} заметок пользователя {user_id}")
+        raise
+    return stats
+
+
+# --- CLI ---
+
+@click.command('import-notes')
+@with_appcontext
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--user', 'username', required=True, help='Владелец импортируемых заметок.')
+@click.option('--format', 'format_name', type=click.Choice([handler.name for handler in HANDLERS]),
+              help='Формат (по умолчанию - по расширению; каталог - хранилище Obsidian).')
+@click.option('--notebook', 'notebook_name', default=None, help='Блокнот для заметок без блокнота в файле.')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+def import_notes_command(path, username, format_name, notebook_name, batch_size):
+    """Импортирует файл (.md, .html, .enex, .zip) или каталог хранилища Obsidian."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'Пользователь "{username}" не найден.')
+    notebook_id = None
+    if notebook_name:
+        notebook = Notebook.query.filter_by(user_id=user.id, name=notebook_name).first()
+        if notebook is None:
+            raise click.ClickException(f'Блокнот "{notebook_name}" не найден.')
+        notebook_id = notebook.id
+
+    def progress(count):
+        click.echo(f'\rИмпортировано заметок: {count}', nl=False)
+
+    try:
+        if os.path.isdir(path):
+            handler = handler_for(path, format_name or 'obsidian')
+            if not hasattr(handler, 'parse_directory'):
+                raise ImportFormatError(f'Формат {handler.name} не поддерживает импорт каталога')
+            stats = import_notes(user.id, handler.parse_directory(path), notebook_id, batch_size, progress)
+        else:
+            with open(path, 'rb') as f:
+                items = handler_for(path, format_name).parse(f, os.path.basename(path))
+                stats = import_notes(user.id, items, notebook_id, batch_size, progress)
+    except ImportFormatError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'\rИмпортировано заметок: {stats.notes}, новых тегов: {stats.tags}, '
+               f'новых блокнотов: {stats.notebooks}.')
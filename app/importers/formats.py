@@ -0,0 +1,215 @@
+# app/importers/formats.py
+"""Обработчики форматов импорта.
+
+Каждый обработчик - класс с атрибутами name, label, extensions и методом
+parse(stream, filename), который по одной отдает ImportedNote. Файл не
+читается в память целиком там, где формат это позволяет: ENEX разбирается
+потоково (iterparse), архив Obsidian - по одному файлу архива.
+"""
+import os
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from datetime import datetime, timezone
+
+from app.importers.html2md import html_title, html_to_markdown
+
+TITLE_MAX_LENGTH = 120 # = длина Note.title
+MEMBER_MAX_SIZE = 32 * 1024 * 1024 # Файлы архива крупнее пропускаются (защита от zip-бомб)
+
+
+class ImportFormatError(ValueError):
+    """Файл не удалось разобрать как файл выбранного формата."""
+
+
+class ImportedNote:
+    """Заметка из внешнего формата, еще не сохраненная в БД."""
+
+    def __init__(self, title, content, tags=(), notebook=None, created_at=None, updated_at=None):
+        self.title = (title or '').strip()[:TITLE_MAX_LENGTH] or 'Без названия'
+        self.content = content
+        self.tags = list(tags)
+        self.notebook = notebook
+        self.created_at = created_at
+        self.updated_at = updated_at or created_at
+
+
+def _decode(data, filename):
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f'Файл {filename} не в кодировке UTF-8') from e
+
+
+def _stem(filename):
+    return os.path.splitext(posixpath.basename(filename))[0]
+
+
+# --- Markdown и текст ---
+
+class MarkdownHandler:
+    name = 'markdown'
+    label = 'Markdown (.md, .txt)'
+    extensions = ('md', 'markdown', 'txt')
+
+    def parse(self, stream, filename):
+        content = _decode(stream.read(), filename)
+        title = f'Импорт: {filename}' # Заголовок по умолчанию
+        # Первая строка вида "# Заголовок" становится заголовком заметки
+        lines = content.split('\n', 1)
+        if lines[0].strip().startswith('# ') and lines[0].strip()[2:].strip():
+            title = lines[0].strip()[2:].strip()
+            content = lines[1].strip() if len(lines) > 1 else ''
+        yield ImportedNote(title, content)
+
+
+# --- HTML ---
+
+class HtmlHandler:
+    name = 'html'
+    label = 'HTML (.html, .htm)'
+    extensions = ('html', 'htm')
+
+    def parse(self, stream, filename):
+        html = _decode(stream.read(), filename)
+        yield ImportedNote(html_title(html) or _stem(filename), html_to_markdown(html))
+
+
+# --- Evernote ENEX ---
+
+def _enex_date(text):
+    """'20200131T235959Z' -> datetime (UTC) или None."""
+    try:
+        return datetime.strptime(text.strip(), '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+    except (AttributeError, ValueError):
+        return None
+
+
+class EnexHandler:
+    """Экспорт Evernote: <en-export><note>...</note>...</en-export>.
+
+    Разбор потоковый: каждая <note> очищается сразу после обработки, а
+    вложения (<resource>, base64) - сразу после закрытия, поэтому память
+    не зависит от размера файла. Вложения не импортируются. Блокнот в ENEX
+    не записывается - им становится имя файла экспорта.
+    """
+    name = 'enex'
+    label = 'Evernote (.enex)'
+    extensions = ('enex',)
+
+    def parse(self, stream, filename):
+        notebook = _stem(filename)
+        root = None
+        try:
+            for event, elem in ET.iterparse(stream, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                        if elem.tag != 'en-export':
+                            raise ImportFormatError(f'{filename}: ожидался корневой элемент <en-export>')
+                    continue
+                if elem.tag == 'resource':
+                    elem.clear() # Данные вложения больше не нужны
+                elif elem.tag == 'note':
+                    yield self._note(elem, notebook)
+                    root.clear() # Освобождаем разобранные заметки
+        except ET.ParseError as e:
+            raise ImportFormatError(f'{filename}: некорректный XML ({e})') from e
+
+    @staticmethod
+    def _note(elem, notebook):
+        content = elem.findtext('content') or ''
+        return ImportedNote(
+            title=elem.findtext('title'),
+            # content - ENML-документ в CDATA: <?xml ...?><!DOCTYPE en-note ...><en-note>...</en-note>
+            content=html_to_markdown(re.sub(r'^\s*<\?xml[^>]*\?>\s*(<!DOCTYPE[^>]*>)?', '', content)),
+            tags=[tag.text for tag in elem.findall('tag') if tag.text],
+            notebook=notebook,
+            created_at=_enex_date(elem.findtext('created')),
+            updated_at=_enex_date(elem.findtext('updated')),
+        )
+
+
+# --- Хранилище Obsidian ---
+
+_FRONTMATTER_RE = re.compile(r'\A---[ \t]*\r?\n(.*?)\r?\n---[ \t]*(?:\r?\n|\Z)', re.S)
+_INLINE_TAG_RE = re.compile(r'(?:^|(?<=\s))#([^\s#.,;:!?()\[\]{}"\'`]+)')
+_CODE_RE = re.compile(r'```.*?```|`[^`\n]*`', re.S)
+# [[папка/Заметка#Раздел|текст]] -> [[Заметка|текст]]: заголовки заметок - имена файлов без пути
+_VAULT_LINK_RE = re.compile(r'\[\[(?:[^\[\]|#\n]*/)?([^\[\]|#\n/]+)(?:#[^\[\]|\n]*)?(\|[^\[\]\n]+)?\]\]')
+
+
+def parse_frontmatter(text):
+    """Отделяет YAML-заголовок: (теги из поля tags, текст без заголовка).
+
+    Полный YAML не нужен: поддерживаются формы `tags: [a, b]`, `tags: a, b`
+    и список строками `- a`.
+    """
+    match = _FRONTMATTER_RE.match(text)
+    if not match:
+        return [], text
+    tags, in_tags = [], False
+    for line in match.group(1).splitlines():
+        key, sep, value = line.partition(':')
+        if sep and not line.startswith((' ', '\t', '-')):
+            in_tags = key.strip() in ('tags', 'tag')
+            if in_tags and value.strip():
+                tags.extend(value.strip().strip('[]').split(','))
+        elif in_tags and line.strip().startswith('-'):
+            tags.append(line.strip()[1:])
+    tags = [tag.strip().strip('"\'').lstrip('#') for tag in tags]
+    return [tag for tag in tags if tag], text[match.end():]
+
+
+class ObsidianHandler:
+    """Хранилище Obsidian в zip-архиве (или каталог - для `flask import-notes`).
+
+    Заголовок - имя файла, блокнот - папка верхнего уровня, теги - из
+    YAML-заголовка и #тегов в тексте. Ссылки [[...]] Obsidian совпадают с
+    вики-ссылками приложения и связываются после импорта.
+    """
+    name = 'obsidian'
+    label = 'Obsidian (.zip с хранилищем)'
+    extensions = ('zip',)
+
+    def parse(self, stream, filename):
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile as e:
+            raise ImportFormatError(f'{filename}: не zip-архив') from e
+        with archive:
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and info.file_size <= MEMBER_MAX_SIZE and self._wanted(info.filename)]
+            # Хранилище часто упаковано в одну корневую папку - ее блокнотом не считаем
+            roots = {info.filename.split('/')[0] for info in members}
+            strip = len(roots) == 1 and all('/' in info.filename for info in members)
+            for info in members:
+                path = info.filename.split('/', 1)[1] if strip else info.filename
+                with archive.open(info) as member:
+                    yield self._note(path, member.read(), info.filename)
+
+    def parse_directory(self, path):
+        for directory, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.')) # .obsidian, .trash, .git
+            for name in sorted(files):
+                relative = os.path.relpath(os.path.join(directory, name), path).replace(os.sep, '/')
+                if self._wanted(relative):
+                    with open(os.path.join(directory, name), 'rb') as f:
+                        yield self._note(relative, f.read(), relative)
+
+    @staticmethod
+    def _wanted(path):
+        parts = path.split('/')
+        return path.lower().endswith('.md') and not any(part.startswith(('.', '__MACOSX')) for part in parts)
+
+    @staticmethod
+    def _note(path, data, filename):
+        tags, content = parse_frontmatter(_decode(data, filename))
+        tags += _INLINE_TAG_RE.findall(_CODE_RE.sub('', content))
+        content = _VAULT_LINK_RE.sub(lambda m: f'[[{m.group(1).strip()}{m.group(2) or ""}]]', content)
+        folder, _, _ = path.rpartition('/')
+        return ImportedNote(_stem(path), content, tags=tags, notebook=folder.split('/')[0] if folder else None)
+
+
+HANDLERS = [MarkdownHandler(), HtmlHandler(), EnexHandler(), ObsidianHandler()]
@@ -0,0 +1,196 @@
+# app/importers/html2md.py
+"""Преобразование HTML (и ENML из Evernote) в Markdown.
+
+Поддерживается то, что встречается в экспортах заметок: заголовки, абзацы,
+выделение, ссылки, изображения, списки (в том числе вложенные и чекбоксы
+<en-todo>), цитаты, код, таблицы и горизонтальные линии. Неизвестные теги
+отбрасываются, их текст сохраняется; <script> и <style> удаляются целиком.
+"""
+import re
+from html import unescape
+from html.parser import HTMLParser
+
+_BLOCK_TAGS = {'p', 'div', 'section', 'article', 'header', 'footer', 'en-note', 'body', 'center'}
+_SKIP_TAGS = {'script', 'style', 'head', 'title', 'en-media'}
+_INLINE_MARKS = {'strong': '**', 'b': '**', 'em': '*', 'i': '*', 's': '~~', 'strike': '~~', 'del': '~~'}
+_SPACES_RE = re.compile(r'[ \t\r\n]+')
+_ESCAPE_RE = re.compile(r'([\\`*_<])') # Символы, которые Markdown принял бы за разметку ([[...]] оставляем ссылками)
+
+
+class _MarkdownBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.lists = [] # Стек списков: ['ul' | ['ol', номер]]
+        self.links = [] # Стек href открытых ссылок
+        self.skip = 0
+        self.pre = 0
+        self.code = 0
+        self.quotes = [] # Внешние буферы вывода открытых <blockquote>
+        self.table = None # Строки текущей таблицы: [[ячейка, ...], ...]
+        self.cell = None
+
+    # --- Вывод ---
+
+    def write(self, text):
+        if self.cell is not None:
+            self.cell.append(text)
+        else:
+            self.out.append(text)
+
+    def block(self, blank=True):
+        """Начинает новый блок: пустая строка (или перевод строки внутри списка)."""
+        if self.cell is not None:
+            self.cell.append(' ')
+            return
+        text = ''.join(self.out).rstrip(' ')
+        self.out = [text]
+        if not text:
+            return
+        stripped = text.rstrip('\n')
+        # Переводы строк только добавляются: пустую строку перед списком не съедает первый пункт
+        newlines = max(len(text) - len(stripped), 2 if blank and not self.lists else 1)
+        self.out = [stripped + '\n' * newlines]
+
+    # --- Разбор ---
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in _SKIP_TAGS:
+            self.skip += 1
+            return
+        if self.skip:
+            return
+        if tag in _BLOCK_TAGS:
+            self.block()
+        elif re.fullmatch(r'h[1-6]', tag):
+            self.block()
+            self.write('#' * int(tag[1]) + ' ')
+        elif tag == 'br':
+            self.write('\n' if self.cell is None else ' ')
+        elif tag == 'hr':
+            self.block()
+            self.write('---')
+            self.block()
+        elif tag in _INLINE_MARKS:
+            self.write(_INLINE_MARKS[tag])
+        elif tag == 'code' and not self.pre:
+            self.write('`')
+            self.code += 1
+        elif tag == 'pre':
+            self.block()
+            self.write('```\n')
+            self.pre += 1
+        elif tag == 'blockquote':
+            self.block()
+            self.quotes.append(self.out) # Цитата собирается отдельно, '> ' добавляется в конце
+            self.out = []
+        elif tag in ('ul', 'ol'):
+            self.block(blank=not self.lists)
+            self.lists.append('ul' if tag == 'ul' else ['ol', int(attrs.get('start') or 1)])
+        elif tag == 'li':
+            self.block(blank=False)
+            indent = '    ' * (len(self.lists) - 1)
+            current = self.lists[-1] if self.lists else 'ul'
+            if current == 'ul':
+                self.write(f'{indent}- ')
+            else:
+                self.write(f'{indent}{current[1]}. ')
+                current[1] += 1
+        elif tag == 'en-todo':
+            self.write('[x] ' if attrs.get('checked') == 'true' else '[ ] ')
+        elif tag == 'a':
+            self.links.append(attrs.get('href'))
+            if attrs.get('href'):
+                self.write('[')
+        elif tag == 'img':
+            src = attrs.get('src')
+            if src and not src.startswith('data:'):
+                self.write(f'![{attrs.get("alt") or ""}]({src})')
+        elif tag == 'table':
+            self.block()
+            self.table = []
+        elif tag == 'tr' and self.table is not None:
+            self.table.append([])
+        elif tag in ('td', 'th') and self.table is not None:
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self.skip = max(0, self.skip - 1)
+            return
+        if self.skip:
+            return
+        if tag in _BLOCK_TAGS or re.fullmatch(r'h[1-6]', tag):
+            self.block()
+        elif tag in _INLINE_MARKS:
+            self.write(_INLINE_MARKS[tag])
+        elif tag == 'code' and self.code:
+            self.code -= 1
+            self.write('`')
+        elif tag == 'pre' and self.pre:
+            self.pre -= 1
+            self.write('\n```')
+            self.block()
+        elif tag == 'blockquote' and self.quotes:
+            inner = re.sub(r'\n{3,}', '\n\n', ''.join(self.out)).strip('\n')
+            self.out = self.quotes.pop()
+            self.write('\n'.join(f'> {line}'.rstrip() for line in inner.splitlines()))
+            self.block()
+        elif tag in ('ul', 'ol') and self.lists:
+            self.lists.pop()
+            self.block(blank=not self.lists)
+        elif tag == 'a' and self.links:
+            href = self.links.pop()
+            if href:
+                self.write(f']({href})')
+        elif tag in ('td', 'th') and self.cell is not None:
+            if self.table:
+                self.table[-1].append(''.join(self.cell).strip().replace('|', '\\|'))
+            self.cell = None
+        elif tag == 'table' and self.table is not None:
+            rows, self.table = [row for row in self.table if row], None
+            if rows:
+                width = max(len(row) for row in rows)
+                rows = [row + [''] * (width - len(row)) for row in rows]
+                lines = ['| ' + ' | '.join(rows[0]) + ' |', '|' + ' --- |' * width]
+                lines += ['| ' + ' | '.join(row) + ' |' for row in rows[1:]]
+                self.write('\n'.join(lines))
+            self.block()
+
+    def handle_data(self, data):
+        if self.skip:
+            return
+        if self.pre:
+            self.write(data)
+            return
+        text = _SPACES_RE.sub(' ', data)
+        if not text.strip() and (not self.out or self.out[-1].endswith(('\n', ' '))):
+            return
+        self.write(text if self.code else _ESCAPE_RE.sub(r'\\\1', text))
+
+    def result(self):
+        while self.quotes: # Незакрытые цитаты
+            self.handle_endtag('blockquote')
+        self.block()
+        text = ''.join(self.out)
+        text = re.sub(r'\n{3,}', '\n\n', text)
+        return '\n'.join(line.rstrip() for line in text.splitlines()).strip() + '\n'
+
+
+def html_to_markdown(html):
+    """Возвращает Markdown для HTML-фрагмента или документа."""
+    builder = _MarkdownBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.result()
+
+
+def html_title(html):
+    """Содержимое <title> или первого <h1> (без тегов), либо None."""
+    match = re.search(r'<title[^>]*>(.*?)</title>', html, re.I | re.S) or \
+        re.search(r'<h1[^>]*>(.*?)</h1>', html, re.I | re.S)
+    if not match:
+        return None
+    title = _SPACES_RE.sub(' ', unescape(re.sub(r'<[^>]+>', '', match.group(1)))).strip()
+    return title or None
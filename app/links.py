@@ -0,0 +1,184 @@
+# app/links.py
+"""Ссылки между заметками: синтаксис [[Заголовок]] и [[Заголовок|текст]].
+
+Ссылки хранятся в таблице note_links и обновляются инкрементально при
+сохранении заметки. Рендеринг берет разрешенные ссылки заметки одним
+запросом, обратные ссылки - одним поиском по индексу target_id.
+Заголовки ищутся среди заметок автора исходной заметки, точным совпадением.
+"""
+import re
+
+import click
+from flask import url_for
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, insert, select, update
+
+from app import db
+from app.models import Note, note_access, note_links
+from app.rendering import WIKILINK_PATTERN, wikilink_title
+
+WIKILINK_RE = re.compile(WIKILINK_PATTERN)
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_LIST_ITEM_RE = re.compile(r'^[ \t]*([-*+]|\d+\.)[ \t]')
+# `код` внутри абзаца (может переноситься на следующую строку, но не через пустую)
+_CODE_SPAN_RE = re.compile(r'(`+)(?:[^`\n]|\n(?![ \t]*\n))+?\1(?!`)')
+
+links_cli = AppGroup('links', help='Обслуживание таблицы ссылок между заметками.')
+
+
+def _strip_code(content):
+    """Текст без блоков кода (``` и ~~~, с отступом) и `inline`-кода - так же, как их пропускает рендер.
+
+    Построчный разбор вместо второго прогона Markdown при каждом сохранении.
+    """
+    lines = []
+    fence = None
+    previous_blank = True
+    in_list = False # Строки с отступом после пункта списка - его продолжение, а не код
+    for line in content.splitlines():
+        if fence:
+            if line.lstrip(' ').startswith(fence):
+                fence = None
+            continue
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+            continue
+        if not line.strip():
+            previous_blank = True
+            lines.append('')
+            continue
+        indented = line.startswith(('    ', '\t'))
+        if indented and previous_blank and not in_list:
+            continue # Блок кода с отступом (previous_blank остается True до конца блока)
+        if not indented:
+            in_list = bool(_LIST_ITEM_RE.match(line))
+        previous_blank = False
+        lines.append(line)
+    return _CODE_SPAN_RE.sub('', '\n'.join(lines))
+
+
+def extract_titles(content):
+    """Множество заголовков, на которые ссылается текст (ссылки внутри кода не учитываются)."""
+    if '[[' not in (content or ''):
+        return set()
+    return {wikilink_title(match.group(1)) for match in WIKILINK_RE.finditer(_strip_code(content))} - {''}
+
+
+def _resolve(user_id, titles):
+    """{заголовок: id} для заметок пользователя; при дублях берется самая старая."""
+    if not titles:
+        return {}
+    rows = db.session.execute(
+        select(Note.title, db.func.min(Note.id))
+        .where(Note.user_id == user_id, Note.title.in_(titles))
+        .group_by(Note.title)
+    ).all()
+    return dict(rows)
+
+
+def update_links(note):
+    """Синхронизирует исходящие ссылки заметки с ее текстом (заметка должна иметь id)."""
+    titles = extract_titles(note.content)
+    existing = set(db.session.scalars(select(note_links.c.target_title).where(note_links.c.source_id == note.id)))
+
+    removed = existing - titles
+    if removed:
+        db.session.execute(delete(note_links).where(note_links.c.source_id == note.id,
+                                                    note_links.c.target_title.in_(removed)))
+    added = titles - existing
+    if added:
+        resolved = _resolve(note.user_id, added)
+        db.session.execute(insert(note_links), [
+            {'source_id': note.id, 'target_title': title, 'target_id': resolved.get(title)}
+            for title in added
+        ])
+
+
+def retarget(note):
+    """Перепривязывает ссылки после создания заметки или смены ее заголовка.
+
+    Ссылки на старый заголовок отвязываются, "висящие" ссылки автора на новый
+    заголовок привязываются к этой заметке.
+    """
+    db.session.execute(
+        update(note_links)
+        .where(note_links.c.target_id == note.id, note_links.c.target_title != note.title)
+        .values(target_id=None)
+    )
+    owner_sources = select(Note.id).where(Note.user_id == note.user_id)
+    db.session.execute(
+        update(note_links)
+        .where(note_links.c.target_title == note.title, note_links.c.target_id.is_(None),
+               note_links.c.source_id.in_(owner_sources))
+        .values(target_id=note.id)
+    )
+
+
+def retarget_new(notes):
+    """Привязывает "висящие" ссылки автора к только что созданным заметкам - один UPDATE на пачку.
+
+    Для новых заметок достаточно второй половины retarget(): по id на них еще
+    никто не ссылается. Заметки должны быть одного автора и уже иметь id.
+    """
+    if not notes:
+        return
+    user_id = notes[0].user_id
+    # Как в _resolve: при дублях заголовка - самая старая заметка
+    oldest = select(db.func.min(Note.id))\
+        .where(Note.user_id == user_id, Note.title == note_links.c.target_title)\
+        .scalar_subquery()
+    db.session.execute(
+        update(note_links)
+        .where(note_links.c.target_title.in_({note.title for note in notes}), note_links.c.target_id.is_(None),
+               note_links.c.source_id.in_(select(Note.id).where(Note.user_id == user_id)))
+        .values(target_id=oldest)
+    )
+
+
+def link_map(note, public=False, external=False):
+    """{заголовок: url} для разрешенных ссылок заметки - один запрос на рендер.
+
+    В публичном режиме ссылки ведут только на опубликованные заметки.
+    """
+    query = select(note_links.c.target_title, Note.id, Note.public_slug)\
+        .join(Note, Note.id == note_links.c.target_id)\
+        .where(note_links.c.source_id == note.id)
+    if public:
+        query = query.where(Note.is_public.is_(True))
+    links = {}
+    for title, target_id, slug in db.session.execute(query):
+        if public:
+            links[title] = url_for('main.public_view_note', slug=slug, _external=external)
+        else:
+            links[title] = url_for('main.view_note', note_id=target_id, _external=external)
+    return links
+
+
+def backlinks(note, user_id):
+    """Заметки, ссылающиеся на данную и доступные пользователю."""
+    return db.session.execute(
+        select(Note.id, Note.title)
+        .join(note_links, note_links.c.source_id == Note.id)
+        .join(note_access, and_(note_access.c.note_id == Note.id, note_access.c.user_id == user_id))
+        .where(note_links.c.target_id == note.id)
+        .order_by(Note.title)
+    ).all()
+
+
+@links_cli.command('rebuild')
+@click.option('--batch-size', default=500, show_default=True)
+def rebuild_command(batch_size):
+    """Заполняет note_links по текстам всех заметок (после миграции)."""
+    total = 0
+    last_id = 0
+    while True:
+        notes = Note.query.filter(Note.id > last_id).order_by(Note.id).limit(batch_size).all()
+        if not notes:
+            break
+        for note in notes:
+            update_links(note)
+        db.session.commit()
+        total += len(notes)
+        last_id = notes[-1].id
+    click.echo(f'Ссылки обновлены для {total} заметок.')
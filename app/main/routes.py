@@ -1,27 +1,53 @@
 import io  # Для работы с файлами в памяти
-import markdown
-from flask import abort, current_app
+import os
+import zipfile
+from urllib.parse import urlsplit
+from flask import abort, current_app, jsonify
 from flask import (
     render_template, request, flash, redirect, url_for, send_file  # Добавлены send_file, make_response, current_app
 )
 from flask_login import login_required, current_user
-from sqlalchemy import or_  # Нужен для index
+from sqlalchemy.orm import defer, selectinload
 from werkzeug.utils import secure_filename  # Для безопасных имен файлов
 
-from app import db
-from app.forms import NoteForm, NotebookForm, ShareNoteForm, ImportForm
+from app import db, limiter, shared
+from app import access, autocomplete, bulk, importers, links, sections
+from app.attachments.storage import attachment_hashes, bundle as bundle_attachments, markdown_link, release_blobs
+from app.forms import NoteForm, NotebookForm, ShareNoteForm, ImportForm, BulkNoteForm, AttachmentForm
 from app.main import bp
-from app.models import User, Note, Tag, Notebook, note_collaborators, note_tags  # Импорт всех моделей
-
+from app.models import User, Note, Tag, Notebook, Attachment, note_tags  # Импорт всех моделей
+from app.ratelimit import by_user, cost_by_size
+from app.rendering import render_markdown
+from app.slugs import publish_notes
+
+
+# Списки заметок не показывают текст: не грузим content, автора и блокнот берем пачкой
+NOTE_LIST_OPTIONS = (defer(Note.content), selectinload(Note.author), selectinload(Note.notebook))
+
+def safe_referrer(default):
+    """Referer, если он ведет на этот же сайт, иначе default (защита от открытого редиректа)."""
+    referrer = request.referrer
+    if referrer:
+        parts = urlsplit(referrer)
+        if parts.scheme in ('http', 'https') and parts.netloc == request.host:
+            return referrer
+    return default
+
+# --- Вспомогательные функции для обработки тегов ---
+def split_tag_names(tag_string):
+    """Разбирает строку тегов через запятую в список уникальных имен."""
+    if not tag_string:
+        return []
+    # Приводим к нижнему регистру, удаляем лишние пробелы, игнорируем пустые, убираем дубликаты
+    return list(set(name.strip().lower() for name in tag_string.split(',') if name.strip()))
 
-# --- Вспомогательная функция для обработки тегов ---
 def process_tags(tag_string):
     """Находит или создает теги из строки, возвращает список объектов Tag."""
-    if not tag_string:
+    tag_names = split_tag_names(tag_string)
+    if not tag_names:
         return []
-    # Приводим к нижнему регистру, удаляем лишние пробелы, игнорируем пустые, убираем дубликаты
-    tag_names = list(set(name.strip().lower() for name in tag_string.split(',') if name.strip()))
     tags = []
+    Tag.mark_used(tag_names) # Защита от удаления сборщиком мусора до коммита заметки
     # Находим существующие теги одним запросом
     existing_tags = Tag.query.filter(Tag.name.in_(tag_names)).all()
     existing_names = {tag.name for tag in existing_tags}
@@ -43,18 +69,12 @@ def process_tags(tag_string):
 @login_required
 def index():
     """Показывает заметки, где пользователь автор ИЛИ соавтор."""
-    # Получаем ID заметок, где текущий пользователь является соавтором
-    # Это можно сделать через subquery или直接 через relationship
-    notes_query = Note.query.filter(
-        or_(
-            Note.user_id == current_user.id, # Заметки автора
-            Note.collaborators.any(User.id == current_user.id) # Заметки, где он соавтор
-        )
-    ).order_by(Note.updated_at.desc())
+    # Проекция note_access содержит и свои, и общие заметки - одно чтение по индексу
+    notes_query = access.accessible_notes(current_user.id).options(*NOTE_LIST_OPTIONS).order_by(Note.updated_at.desc())
 
     notes = notes_query.all()
     # Передаем в шаблон app/templates/main/index.html
-    return render_template('index.html', notes=notes, title='Мои и общие заметки')
+    return render_template('index.html', notes=notes, bulk_form=BulkNoteForm(), title='Мои и общие заметки')
 
 @bp.route('/notes/new', methods=['GET', 'POST'])
 @login_required
@@ -79,6 +99,10 @@ def new_note():
 
         db.session.add(note)
         try:
+            db.session.flush() # Нужен id заметки для таблицы ссылок
+            links.update_links(note)
+            links.retarget(note)
+            sections.sync_sections(note)
             db.session.commit() # Коммитим все изменения (заметка, новые теги)
             flash('Заметка успешно создана!', 'success')
             return redirect(url_for('main.view_note', note_id=note.id))
@@ -96,7 +120,8 @@ def new_note():
 @bp.route('/notes/<int:note_id>')
 @login_required
 def view_note(note_id):
-    note = Note.query.get_or_404(note_id)
+    # Текст большой заметки не грузим целиком - только оглавление и первый раздел
+    note = Note.query.options(defer(Note.content)).get_or_404(note_id)
 
     is_owner = (note.user_id == current_user.id)
     # Правильная проверка статуса соавтора
@@ -105,7 +130,15 @@ def view_note(note_id):
     if not is_owner and not is_collaborator_check: # Используем правильную проверку
         abort(403)
 
-    html_content = markdown.markdown(note.content, extensions=['fenced_code', 'tables', 'extra'])
+    link_map = links.link_map(note)
+    toc = []
+    if note.is_chunked:
+        toc = sections.table_of_contents(note.id)
+        first_section = sections.get_section(note.id, 0)
+        html_content = render_markdown(sections.section_text(first_section, sections.get_definitions(note.id)),
+                                       link_map) if first_section else ''
+    else:
+        html_content = render_markdown(note.content, link_map)
     share_form = ShareNoteForm() if is_owner else None
 
     return render_template(
@@ -113,13 +146,30 @@ def view_note(note_id):
         title=note.title,
         note=note,
         html_content=html_content,
+        toc=toc,
         share_form=share_form,
+        backlinks=links.backlinks(note, current_user.id),
+        attachments=note.attachments.order_by(Attachment.created_at).all(),
+        attachment_form=AttachmentForm(),
+        markdown_link=markdown_link,
         is_owner=is_owner,
         is_collaborator=is_collaborator_check, # <--- ПЕРЕДАЕМ РЕАЛЬНЫЙ СТАТУС
         # Этот флаг можно оставить, если он где-то нужен для отображения
         is_shared_only=is_collaborator_check and not is_owner
     )
 
+@bp.route('/notes/<int:note_id>/sections/<int:position>')
+@login_required
+def note_section(note_id, position):
+    """HTML одного раздела большой заметки (подгружается страницей просмотра)."""
+    if not access.can_read(note_id, current_user.id):
+        abort(403)
+    section = sections.get_section(note_id, position)
+    if section is None:
+        abort(404)
+    note = Note.query.options(defer(Note.content)).get_or_404(note_id)
+    return render_markdown(sections.section_text(section, sections.get_definitions(note_id)), links.link_map(note))
+
 @bp.route('/notes/<int:note_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_note(note_id):
@@ -178,6 +228,9 @@ def edit_note(note_id):
 
         # updated_at обновится автоматически благодаря onupdate
         try:
+            links.update_links(note) # Инкрементально: только добавленные/удаленные ссылки
+            links.retarget(note)
+            sections.sync_sections(note)
             db.session.commit()
             flash('Заметка успешно обновлена!', 'success')
             return redirect(url_for('main.view_note', note_id=note.id))
@@ -202,17 +255,97 @@ def delete_note(note_id):
     if note.user_id != current_user.id:
         abort(403)
 
+    hashes = attachment_hashes(Attachment.note_id == note.id) # После удаления строк их уже не узнать
     db.session.delete(note)
     try:
         db.session.commit()
-        flash('Заметка удалена.', 'info')
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Ошибка удаления заметки {note_id}: {e}")
         flash('Ошибка при удалении заметки.', 'danger')
+    else:
+        release_blobs(hashes) # Заметка уже удалена: ошибка с файлами только логируется
+        flash('Заметка удалена.', 'info')
 
     return redirect(url_for('main.index'))
 
+@bp.route('/notes/bulk', methods=['POST'])
+@login_required
+def bulk_notes():
+    """Применяет одно действие к набору заметок одной транзакцией."""
+    form = BulkNoteForm()
+    back = safe_referrer(url_for('main.index'))
+    if not form.validate_on_submit():
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f"{getattr(form, field).label.text if hasattr(getattr(form, field), 'label') else field}: {error}", 'danger')
+        return redirect(back)
+
+    note_ids = set(request.form.getlist('note_ids', type=int))
+    if not note_ids:
+        flash('Не выбрано ни одной заметки.', 'warning')
+        return redirect(back)
+    if len(note_ids) > bulk.BULK_MAX_NOTES:
+        flash(f'За один раз можно обработать не более {bulk.BULK_MAX_NOTES} заметок.', 'warning')
+        return redirect(back)
+
+    action = form.action.data
+    # Теги могут менять и соавторы (как в edit_note), остальное - только автор
+    owner_only = action not in ('tag_add', 'tag_remove')
+    # Проверка доступа ко всему набору одним запросом
+    if access.accessible_note_ids(note_ids, current_user.id, owner_only=owner_only) != note_ids:
+        abort(403)
+
+    hashes = set()
+    try:
+        if action == 'move':
+            notebook_id = None
+            if form.notebook.data != -1:
+                notebook = Notebook.query.filter_by(id=form.notebook.data, user_id=current_user.id).first()
+                if not notebook:
+                    flash("Выбранный блокнот не найден или не принадлежит вам.", "warning")
+                    return redirect(back)
+                notebook_id = notebook.id
+            count = bulk.move_notes(note_ids, notebook_id)
+            message = f'Перемещено заметок: {count}.'
+        elif action == 'tag_add':
+            tags = process_tags(form.tags.data)
+            db.session.flush() # Нужны id новых тегов
+            count = bulk.add_tags(note_ids, [tag.id for tag in tags])
+            message = f'Добавлено связей с тегами: {count}.'
+        elif action == 'tag_remove':
+            count = bulk.remove_tags(note_ids, split_tag_names(form.tags.data))
+            message = f'Удалено связей с тегами: {count}.'
+        elif action in ('share', 'unshare'):
+            user = autocomplete.find_user(form.username.data)
+            if not user:
+                flash(f'Пользователь "{form.username.data}" не найден.', 'warning')
+                return redirect(back)
+            if user.id == current_user.id:
+                flash('Вы не можете поделиться заметкой с самим собой.', 'warning')
+                return redirect(back)
+            if action == 'share':
+                count = bulk.share_notes(note_ids, user.id)
+                message = f'Пользователю "{user.username}" открыт доступ к заметкам: {count}.'
+            else:
+                count = bulk.unshare_notes(note_ids, user.id)
+                message = f'У пользователя "{user.username}" отозван доступ к заметкам: {count}.'
+        else: # delete
+            hashes = attachment_hashes(Attachment.note_id.in_(note_ids))
+            count = bulk.delete_notes(note_ids)
+            message = f'Удалено заметок: {count}.'
+            back = url_for('main.index') # Текущая страница могла перестать существовать
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ошибка массовой операции {action} над {len(note_ids)} заметками: {e}")
+        flash('Ошибка при выполнении массовой операции.', 'danger')
+    else:
+        release_blobs(hashes) # Заметки уже удалены: ошибка с файлами только логируется
+        flash(message, 'success')
+
+    return redirect(back)
+
 # --- Маршруты Блокнотов ---
 
 @bp.route('/notebooks')
@@ -279,8 +412,8 @@ def notes_in_notebook(notebook_id):
     notebook = Notebook.query.filter_by(id=notebook_id, user_id=current_user.id).first_or_404()
     # Показываем заметки только из этого блокнота
     # Доступ (автор/соавтор) проверяется при отображении списка или при переходе к заметке
-    notes = Note.query.filter_by(notebook_id=notebook.id).order_by(Note.updated_at.desc()).all()
-    return render_template('index.html', notes=notes, notebook_context=notebook, title=f'Заметки в блокноте: {notebook.name}')
+    notes = Note.query.filter_by(notebook_id=notebook.id).options(*NOTE_LIST_OPTIONS).order_by(Note.updated_at.desc()).all()
+    return render_template('index.html', notes=notes, notebook_context=notebook, bulk_form=BulkNoteForm(), title=f'Заметки в блокноте: {notebook.name}')
 
 
 # --- Маршруты Тегов ---
@@ -288,28 +421,34 @@ def notes_in_notebook(notebook_id):
 @bp.route('/tags/<string:tag_name>')
 @login_required
 def notes_by_tag(tag_name):
-    tag = Tag.query.filter(Tag.name.ilike(tag_name)).first_or_404() # Регистронезависимый поиск тега
-
-    # Получаем ID доступных заметок (автор или соавтор)
-    collaborating_note_ids = db.session.query(note_collaborators.c.note_id)\
-        .filter_by(user_id=current_user.id)\
-        .subquery()
-
-    # Фильтруем заметки с этим тегом, которые доступны пользователю
-    notes = Note.query.join(note_tags).join(Tag).filter(
-        Tag.id == tag.id, # Присоединяем по тегу
-        or_(
-            Note.user_id == current_user.id,
-            Note.id.in_(collaborating_note_ids)
-        )
+    tag = Tag.query.filter_by(name=tag_name.strip().lower()).first_or_404() # Теги хранятся в нижнем регистре
+
+    # Фильтруем заметки с этим тегом, которые доступны пользователю (автор или соавтор)
+    notes = access.accessible_notes(current_user.id).options(*NOTE_LIST_OPTIONS).join(note_tags).filter(
+        note_tags.c.tag_id == tag.id
     ).order_by(Note.updated_at.desc()).all()
 
-    return render_template('index.html', notes=notes, tag_context=tag, title=f'Заметки с тегом: {tag.name}')
+    return render_template('index.html', notes=notes, tag_context=tag, bulk_form=BulkNoteForm(), title=f'Заметки с тегом: {tag.name}')
+
+
+# --- Автодополнение (JSON для полей тегов и имени пользователя) ---
+
+@bp.route('/autocomplete/tags')
+@login_required
+def autocomplete_tags():
+    return jsonify(autocomplete.suggest_tags(current_user.id, request.args.get('q', '')))
+
+
+@bp.route('/autocomplete/users')
+@login_required
+def autocomplete_users():
+    return jsonify(autocomplete.suggest_usernames(request.args.get('q', ''), exclude=current_user.username))
 
 
 # --- Маршруты Сотрудничества (Collaboration) ---
 @bp.route('/notes/<int:note_id>/share', methods=['POST'])
 @login_required
+@limiter.limit('30/minute', keys=(by_user,))
 def share_note(note_id):
     note = Note.query.get_or_404(note_id)
     # >>> ПРОВЕРКА: Только автор может делиться <<<
@@ -319,7 +458,7 @@ def share_note(note_id):
     form = ShareNoteForm() # Используем форму для валидации CSRF и базовых проверок
     if form.validate_on_submit():
         # Валидаторы в форме уже проверили существование пользователя и не-самого-себя
-        user_to_share = User.query.filter(User.username.ilike(form.username.data)).first()
+        user_to_share = autocomplete.find_user(form.username.data)
 
         # >>> ДОБАВЛЕНА ПРОВЕРКА: Не является ли пользователь уже соавтором? <<<
         if note.collaborators.filter(User.id == user_to_share.id).count() > 0:
@@ -328,6 +467,8 @@ def share_note(note_id):
             # Если все проверки пройдены, добавляем в соавторы
             note.collaborators.append(user_to_share)
             try:
+                db.session.flush()
+                access.grant([note.id], user_to_share.id)
                 db.session.commit()
                 flash(f'Заметка "{note.title}" теперь доступна пользователю "{user_to_share.username}".', 'success')
             except Exception as e:
@@ -358,6 +499,7 @@ def unshare_note(note_id, user_id):
     if note.collaborators.filter(User.id == user_to_unshare.id).count() > 0:
         note.collaborators.remove(user_to_unshare) # Удаляем из связи
         try:
+            access.revoke([note.id], user_to_unshare.id)
             db.session.commit()
             flash(f'Доступ к заметке для пользователя "{user_to_unshare.username}" отозван.', 'success')
         except Exception as e:
@@ -414,12 +556,48 @@ def unpublish_note(note_id):
         flash('Заметка не была опубликована.', 'info')
     return redirect(url_for('main.view_note', note_id=note_id))
 
+@bp.route('/notebooks/<int:notebook_id>/publish', methods=['POST'])
+@login_required
+def publish_notebook(notebook_id):
+    notebook = Notebook.query.filter_by(id=notebook_id, user_id=current_user.id).first_or_404()
+    # Публиковать можно только свои заметки
+    note_ids = db.session.scalars(
+        db.select(Note.id).where(Note.notebook_id == notebook.id, Note.user_id == current_user.id)
+    ).all()
+    try:
+        published = publish_notes(note_ids)
+        db.session.commit()
+        flash(f'Опубликовано заметок: {published}.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ошибка публикации блокнота {notebook_id}: {e}")
+        flash('Ошибка при публикации заметок блокнота.', 'danger')
+    return redirect(url_for('main.notes_in_notebook', notebook_id=notebook_id))
+
+@bp.route('/tags/<string:tag_name>/publish', methods=['POST'])
+@login_required
+def publish_tag(tag_name):
+    tag = Tag.query.filter_by(name=tag_name.strip().lower()).first_or_404()
+    note_ids = db.session.scalars(
+        db.select(Note.id).join(note_tags).where(note_tags.c.tag_id == tag.id, Note.user_id == current_user.id)
+    ).all()
+    try:
+        published = publish_notes(note_ids)
+        db.session.commit()
+        flash(f'Опубликовано заметок: {published}.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Ошибка публикации заметок с тегом {tag_name}: {e}")
+        flash('Ошибка при публикации заметок с тегом.', 'danger')
+    return redirect(url_for('main.notes_by_tag', tag_name=tag.name))
+
 # Публичный просмотр (БЕЗ @login_required!)
 @bp.route('/public/<string:slug>')
 def public_view_note(slug):
     # Ищем опубликованную заметку по slug
     note = Note.query.filter_by(public_slug=slug, is_public=True).first_or_404()
-    html_content = markdown.markdown(note.content, extensions=['fenced_code', 'tables', 'extra'])
+    # Ссылки ведут только на другие опубликованные заметки
+    html_content = render_markdown(note.content, links.link_map(note, public=True))
     # Используем отдельный шаблон для публичного просмотра
     return render_template('public_note_view.html', note=note, html_content=html_content, title=note.title)
 
@@ -466,7 +644,7 @@ def export_note_html(note_id):
     if not is_owner and not is_collaborator:
         abort(403) # Доступ запрещен
 
-    html_content = markdown.markdown(note.content, extensions=['fenced_code', 'tables', 'extra'])
+    html_content = render_markdown(note.content, links.link_map(note, external=True))
     # Создаем полный HTML документ со стилями (ваш код HTML здесь без изменений)
     full_html = f"""<!DOCTYPE html>
 <html lang="ru">
@@ -508,51 +686,76 @@ def export_note_html(note_id):
         as_attachment=True
     )
 
+@bp.route('/notes/<int:note_id>/export/zip')
+@login_required
+def export_note_zip(note_id):
+    """Экспорт заметки вместе с вложениями: note.md + attachments/."""
+    note = Note.query.get_or_404(note_id)
+    if not access.can_read(note.id, current_user.id):
+        abort(403)
+
+    base_name = secure_filename(note.title[:50].replace(' ', '_') or 'note')
+    mem_file = io.BytesIO()
+    # Вложения уже сжаты (изображения, pdf) - кладем их без повторного сжатия
+    with zipfile.ZipFile(mem_file, 'w', compression=zipfile.ZIP_STORED) as zip_file:
+        content = bundle_attachments(zip_file, note, note.content)
+        zip_file.writestr(f'{base_name}.md', f"# {note.title}\n\n{content}".encode('utf-8'),
+                          compress_type=zipfile.ZIP_DEFLATED)
+    mem_file.seek(0)
+
+    return send_file(
+        mem_file,
+        mimetype='application/zip',
+        download_name=f'{base_name}.zip',
+        as_attachment=True
+    )
+
 @bp.route('/import', methods=['GET', 'POST'])
 @login_required
+@limiter.limit('60/hour', keys=(by_user,), burst=20, cost=cost_by_size()) # 1 токен + 1 за каждый МБ
+@limiter.expensive
 def import_notes():
     form = ImportForm()
     if form.validate_on_submit():
-        f = form.md_file.data
-        filename = secure_filename(f.filename)
-        try:
-            content = f.read().decode('utf-8')
-            # Определение заголовка: первая строка вида "# Заголовок"
-            lines = content.split('\n', 1)
-            title = f"Импорт: {filename}" # Заголовок по умолчанию
-            note_content = content # Содержимое по умолчанию
-
-            if lines[0].strip().startswith('# '): # Решетка и пробел
-                potential_title = lines[0].strip()[2:].strip() # Убираем '# ' и пробелы
-                if potential_title: # Убедимся, что заголовок не пустой
-                    title = potential_title
-                    note_content = lines[1].strip() if len(lines) > 1 else '' # Остальное - содержимое
-
-            new_note = Note(title=title, content=note_content, author=current_user)
-
-            # Опционально: добавляем в выбранный блокнот
-            # notebook_id = form.notebook.data
-            # if notebook_id != -1:
-            #     notebook = Notebook.query.filter_by(id=notebook_id, user_id=current_user.id).first()
-            #     if notebook:
-            #         new_note.notebook_id = notebook_id
-            #     else:
-            #         flash(f"Выбранный блокнот ({notebook_id}) не найден, импортировано без блокнота.", "warning")
-
-            db.session.add(new_note)
-            db.session.commit()
-            flash(f'Заметка "{new_note.title}" успешно импортирована!', 'success')
-            return redirect(url_for('main.view_note', note_id=new_note.id))
+        f = form.file.data
+        # Имя нужно только для сообщений и имени блокнота ENEX: secure_filename вырезал бы кириллицу
+        filename = os.path.basename(f.filename.replace('\\', '/'))
+        progress_key = f'import-progress:{current_user.id}'
+
+        def progress(count):
+            shared.set(progress_key, {'imported': count, 'done': False}, ttl=3600)
 
-        except UnicodeDecodeError:
-             flash('Ошибка декодирования файла. Убедитесь, что файл сохранен в кодировке UTF-8.', 'danger')
-             current_app.logger.warning(f"Ошибка декодирования при импорте файла {filename}")
+        try:
+            handler = importers.handler_for(filename)
+            stats = importers.import_notes(
+                current_user.id, handler.parse(f.stream, filename),
+                notebook_id=form.notebook.data if form.notebook.data != -1 else None,
+                progress=progress
+            )
+        except importers.ImportFormatError as e:
+            flash(f'Не удалось импортировать файл: {e}', 'danger')
+            current_app.logger.warning(f"Ошибка формата при импорте файла {filename}: {e}")
         except Exception as e:
-            db.session.rollback()
             current_app.logger.error(f"Ошибка импорта файла {filename}: {e}", exc_info=True) # Логируем с трейсбеком
             flash(f'Произошла непредвиденная ошибка при импорте файла. См. логи сервера.', 'danger')
+        else:
+            if stats.notes == 1:
+                flash('Заметка успешно импортирована!', 'success')
+                return redirect(url_for('main.view_note', note_id=stats.last_note_id))
+            flash(f'Импортировано заметок: {stats.notes}, новых тегов: {stats.tags}, '
+                  f'новых блокнотов: {stats.notebooks}.', 'success')
+            return redirect(url_for('main.index'))
+        finally:
+            shared.delete(progress_key)
 
-    return render_template('import.html', title='Импорт заметок', form=form)
+    return render_template('import.html', title='Импорт заметок', form=form, formats=importers.HANDLERS)
+
+
+@bp.route('/import/progress')
+@login_required
+def import_progress():
+    """Сколько заметок уже сохранил идущий импорт пользователя (опрашивается страницей импорта)."""
+    return jsonify(shared.get(f'import-progress:{current_user.id}') or {'imported': 0})
 
 
 # --- Обработчики ошибок ---
@@ -564,6 +767,22 @@ def forbidden_error(error):
 def not_found_error(error):
     return render_template('404.html'), 404
 
+@bp.app_errorhandler(413)
+def request_too_large_error(error):
+    # Тело запроса не читается: формы здесь создаются без данных
+    max_mb = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    if request.endpoint == 'main.import_notes' and current_user.is_authenticated:
+        flash(f'Файл слишком большой для импорта (максимум {max_mb} МБ).', 'danger')
+        return render_template('import.html', title='Импорт заметок', form=ImportForm(formdata=None),
+                               formats=importers.HANDLERS), 413
+    return render_template('413.html', max_mb=max_mb), 413
+
+@bp.app_errorhandler(429)
+def too_many_requests_error(error):
+    retry_after = getattr(error, 'retry_after', None) # Выставляет app/ratelimit.py
+    headers = {'Retry-After': str(retry_after)} if retry_after else {}
+    return render_template('429.html', retry_after=retry_after), 429, headers
+
 @bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback() # Откатываем транзакцию
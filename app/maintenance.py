@@ -0,0 +1,404 @@
+# app/maintenance.py
+"""Плановое обслуживание БД.
+
+- сборка мусора: теги без заметок (process_tags создает их, но не удаляет),
+  строки таблиц связей, ссылающиеся на удаленные записи, и файлы вложений
+  без строк Attachment;
+- VACUUM/ANALYZE: инкрементальный VACUUM и PRAGMA optimize для SQLite;
+- проверка ссылочной целостности таблиц связей и размеры таблиц/индексов.
+
+Удаление идет пачками по batch_size строк с коммитом после каждой пачки,
+чтобы не держать блокировку записи SQLite долго. Команды доступны как
+`flask maintenance ...`; при MAINTENANCE_INTERVAL > 0 легкие задачи
+(`flask maintenance run`) выполняются фоновым потоком приложения.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, exists, func, select, text, tuple_, update
+
+from app import db, limiter, shared
+from app.attachments import storage
+from app.models import Tag, note_access, note_collaborators, note_links, note_tags
+
+# Таблицы связей, у которых проверяются внешние ключи
+ASSOCIATION_TABLES = (note_tags, note_collaborators, note_access, note_links)
+
+maintenance_cli = AppGroup('maintenance', help='Обслуживание БД: сборка мусора, VACUUM/ANALYZE, проверки.')
+
+
+def _is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def _pause():
+    """Пауза между пачками, чтобы между ними успевали проходить записи приложения."""
+    time.sleep(current_app.config['MAINTENANCE_BATCH_PAUSE'])
+
+
+# --- Сборка мусора ---
+
+def _orphan_tag_condition(used_before):
+    return ~exists().where(note_tags.c.tag_id == Tag.id) & \
+        (Tag.last_used_at.is_(None) | (Tag.last_used_at < used_before))
+
+
+def gc_orphan_tags(batch_size):
+    """Удаляет теги, не привязанные ни к одной заметке. Возвращает число удаленных.
+
+    Теги, использованные за последние MAINTENANCE_TAG_GRACE секунд, остаются:
+    сохранение заметки могло найти id тега (Tag.mark_used) и еще не вставить
+    строку note_tags.
+    """
+    used_before = datetime.now(timezone.utc) - timedelta(seconds=current_app.config['MAINTENANCE_TAG_GRACE'])
+    total = 0
+    while True:
+        ids = db.session.scalars(
+            select(Tag.id).where(_orphan_tag_condition(used_before)).order_by(Tag.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        # Условие повторяется в DELETE: тег могли привязать к заметке или отметить после выборки
+        result = db.session.execute(delete(Tag).where(Tag.id.in_(ids), _orphan_tag_condition(used_before)))
+        db.session.commit()
+        total += result.rowcount
+        if len(ids) < batch_size:
+            break
+        _pause()
+    return total
+
+
+def _foreign_keys():
+    """(таблица, колонка, родительская колонка) для всех внешних ключей таблиц связей."""
+    for table in ASSOCIATION_TABLES:
+        for column in table.c:
+            for foreign_key in column.foreign_keys:
+                yield table, column, foreign_key.column
+
+
+def _orphan_condition(column, parent):
+    return column.is_not(None) & ~exists().where(parent == column)
+
+
+def gc_orphan_associations(batch_size):
+    """Удаляет (или обнуляет, если колонка допускает NULL) строки связей без родителя.
+
+    При включенных внешних ключах таких строк не бывает; они остаются от
+    удалений, сделанных до PRAGMA foreign_keys=ON или в обход приложения.
+    Возвращает {'таблица.колонка': число строк}.
+    """
+    counts = {}
+    for table, column, parent in _foreign_keys():
+        primary_key = tuple_(*table.primary_key.columns)
+        total = 0
+        while True:
+            rows = db.session.execute(
+                select(*table.primary_key.columns).where(_orphan_condition(column, parent)).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            batch = primary_key.in_([tuple(row) for row in rows])
+            if column.nullable:
+                db.session.execute(update(table).where(batch).values({column.name: None}))
+            else:
+                db.session.execute(delete(table).where(batch))
+            db.session.commit()
+            total += len(rows)
+            if len(rows) < batch_size:
+                break
+            _pause()
+        counts[f'{table.name}.{column.name}'] = total
+    return counts
+
+
+def _blob_hashes(root):
+    """Хэши всех файлов хранилища вложений (каталог tmp пропускается)."""
+    for directory, dirs, files in os.walk(root):
+        if directory == root:
+            dirs[:] = [name for name in dirs if name != 'tmp']
+        for name in files:
+            if len(name) == 64:
+                yield name
+
+
+def gc_orphan_blobs(batch_size):
+    """Удаляет файлы вложений, на которые не ссылается ни одна строка Attachment.
+
+    Удаление идет через storage.release_blobs - под той же блокировкой, что
+    и запись файлов, и только для файлов старше BLOB_GRACE. Заодно удаляются
+    брошенные временные файлы прерванных загрузок. Возвращает число удаленных файлов.
+    """
+    root = current_app.config['ATTACHMENTS_DIR']
+    if not os.path.isdir(root):
+        return 0
+    total = 0
+    batch = []
+    for sha256 in _blob_hashes(root):
+        batch.append(sha256)
+        if len(batch) >= batch_size:
+            total += storage.release_blobs(batch)
+            batch = []
+            _pause()
+    total += storage.release_blobs(batch)
+
+    tmp_dir = os.path.join(root, 'tmp')
+    deadline = time.time() - storage.BLOB_GRACE
+    for entry in os.scandir(tmp_dir) if os.path.isdir(tmp_dir) else ():
+        try:
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+                total += 1
+        except FileNotFoundError:
+            pass
+    return total
+
+
+# --- VACUUM / ANALYZE ---
+
+def _autocommit(statements):
+    """Выполняет PRAGMA/VACUUM вне транзакции (VACUUM внутри транзакции запрещен)."""
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        results = []
+        for statement in statements:
+            result = conn.execute(text(statement))
+            results.append(result.all() if result.returns_rows else [])
+        return results
+
+
+def auto_vacuum_mode():
+    """0 - NONE, 1 - FULL, 2 - INCREMENTAL."""
+    return _autocommit(['PRAGMA auto_vacuum'])[0][0][0]
+
+
+def incremental_vacuum(pages, max_steps=1000):
+    """Возвращает свободные страницы файлу по pages за шаг. Возвращает число освобожденных."""
+    freed = 0
+    for _ in range(max_steps):
+        free_before = _autocommit(['PRAGMA freelist_count'])[0][0][0]
+        if not free_before:
+            break
+        free_after = _autocommit([f'PRAGMA incremental_vacuum({int(pages)})', 'PRAGMA freelist_count'])[1][0][0]
+        freed += free_before - free_after
+        if free_after == 0 or free_after == free_before:
+            break
+        _pause()
+    return freed
+
+
+def optimize(analysis_limit):
+    """PRAGMA optimize: ANALYZE только тех таблиц, статистика которых устарела.
+
+    analysis_limit ограничивает число просматриваемых строк на индекс.
+    """
+    _autocommit([f'PRAGMA analysis_limit={int(analysis_limit)}', 'PRAGMA optimize'])
+
+
+# --- Проверки и статистика ---
+
+def check_integrity(max_errors=100):
+    """Возвращает список найденных проблем (пустой, если все в порядке)."""
+    problems = []
+    for table, column, parent in _foreign_keys():
+        count = db.session.scalar(
+            select(func.count()).select_from(table).where(_orphan_condition(column, parent))
+        )
+        if count:
+            problems.append(f'{table.name}.{column.name}: {count} строк ссылаются на отсутствующие '
+                            f'{parent.table.name}.{parent.name}')
+    if _is_sqlite():
+        for (message,) in _autocommit([f'PRAGMA quick_check({int(max_errors)})'])[0]:
+            if message != 'ok':
+                problems.append(f'quick_check: {message}')
+    return problems
+
+
+def object_sizes():
+    """[(имя, тип, строк, байт)] для таблиц и индексов; байты - только для SQLite с dbstat."""
+    row_counts = {
+        table.name: db.session.scalar(select(func.count()).select_from(table))
+        for table in db.metadata.sorted_tables
+    }
+    if not _is_sqlite():
+        return [(name, 'table', rows, None) for name, rows in row_counts.items()]
+    try:
+        sizes = dict(_autocommit(['SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'])[0])
+    except Exception: # SQLite собран без SQLITE_ENABLE_DBSTAT_VTAB
+        sizes = {}
+    objects = _autocommit(["SELECT name, type FROM sqlite_master WHERE type IN ('table', 'index') "
+                           "AND name NOT LIKE 'sqlite_%' ORDER BY name"])[0]
+    return [(name, kind, row_counts.get(name), sizes.get(name)) for name, kind in objects]
+
+
+# --- Полный цикл обслуживания ---
+
+def run_maintenance():
+    """Легкие задачи, безопасные при работающем приложении. Возвращает словарь итогов."""
+    config = current_app.config
+    batch_size = config['MAINTENANCE_BATCH_SIZE']
+    summary = {
+        'orphan_associations': sum(gc_orphan_associations(batch_size).values()),
+        'orphan_tags': gc_orphan_tags(batch_size),
+        'orphan_blobs': gc_orphan_blobs(batch_size),
+    }
+    purge = getattr(shared.backend, 'purge', None) # Истекшие записи общего состояния в SQLite
+    if purge is not None:
+        purge()
+    prune = getattr(limiter.store, 'prune', None) # Полные ведра rate limit в SQLite
+    if prune is not None:
+        prune()
+    if _is_sqlite():
+        optimize(config['MAINTENANCE_ANALYSIS_LIMIT'])
+        if auto_vacuum_mode() == 2:
+            summary['freed_pages'] = incremental_vacuum(config['MAINTENANCE_VACUUM_PAGES'])
+    return summary
+
+
+class MaintenanceScheduler:
+    """Фоновый поток, выполняющий run_maintenance раз в MAINTENANCE_INTERVAL секунд.
+
+    Если воркеров несколько, цикл выполняет только тот, кто захватил
+    блокировку в общем хранилище (app.shared); остальные пропускают. Время
+    последнего запуска тоже хранится там, так что воркеры вместе запускают
+    обслуживание не чаще раза в интервал. С SHARED_STATE_URL='memory://'
+    блокировка действует только внутри процесса.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['MAINTENANCE_INTERVAL']
+        self.max_runtime = app.config.get('MAINTENANCE_MAX_RUNTIME', 3600)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='maintenance', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"Ошибка планового обслуживания БД: {e}")
+
+    def run_once(self):
+        # Блокировка снимается в конце запуска; ttl - только на случай, если воркер упал посреди
+        # запуска, поэтому он не зависит от интервала, а покрывает самый долгий запуск
+        with shared.lock('maintenance', ttl=self.max_runtime) as acquired:
+            if not acquired:
+                return None # Обслуживание уже выполняет другой воркер
+            last_run = shared.get('maintenance:last_run')
+            if last_run and time.time() - last_run < self.interval * 0.9: # Допуск на сдвиг циклов воркеров
+                return None # Другой воркер уже выполнил обслуживание в этом интервале
+            summary = run_maintenance()
+            shared.set('maintenance:last_run', time.time(), ttl=self.interval * 2)
+            current_app.logger.info(f"Плановое обслуживание БД: {summary}")
+            return summary
+
+
+def init_scheduler(app):
+    """Запускает фоновое обслуживание, если оно включено в конфигурации."""
+    if not app.config['MAINTENANCE_INTERVAL'] or app.testing:
+        return None
+    # Под отладочным перезапуском Flask поток нужен только в дочернем процессе
+    if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return None
+    scheduler = MaintenanceScheduler(app)
+    scheduler.start()
+    app.extensions['maintenance'] = scheduler
+    return scheduler
+
+
+# --- CLI ---
+
+def _batch_size_option(command):
+    return click.option('--batch-size', type=int, default=None,
+                        help='Строк за одну транзакцию (по умолчанию MAINTENANCE_BATCH_SIZE).')(command)
+
+
+@maintenance_cli.command('gc')
+@_batch_size_option
+def gc_command(batch_size):
+    """Удаляет теги без заметок, строки связей без родительских записей и файлы вложений без ссылок."""
+    batch_size = batch_size or current_app.config['MAINTENANCE_BATCH_SIZE']
+    for name, count in gc_orphan_associations(batch_size).items():
+        if count:
+            click.echo(f'{name}: удалено/обнулено строк: {count}')
+    click.echo(f'Удалено тегов без заметок: {gc_orphan_tags(batch_size)}.')
+    click.echo(f'Удалено файлов вложений без ссылок: {gc_orphan_blobs(batch_size)}.')
+
+
+@maintenance_cli.command('vacuum')
+@click.option('--pages', type=int, default=None, help='Страниц за шаг (по умолчанию MAINTENANCE_VACUUM_PAGES).')
+@click.option('--full', is_flag=True, help='Полный VACUUM (блокирует БД на все время) с переходом на auto_vacuum=INCREMENTAL.')
+def vacuum_command(pages, full):
+    """Возвращает свободное место файлу БД (только SQLite)."""
+    if not _is_sqlite():
+        raise click.ClickException('VACUUM поддерживается только для SQLite.')
+    if full:
+        _autocommit(['PRAGMA auto_vacuum=INCREMENTAL', 'VACUUM'])
+        click.echo('VACUUM выполнен, режим auto_vacuum=INCREMENTAL.')
+        return
+    if auto_vacuum_mode() != 2:
+        raise click.ClickException('БД создана без auto_vacuum=INCREMENTAL: один раз выполните '
+                                   '`flask maintenance vacuum --full` (в окно обслуживания).')
+    freed = incremental_vacuum(pages or current_app.config['MAINTENANCE_VACUUM_PAGES'])
+    click.echo(f'Освобождено страниц: {freed}.')
+
+
+@maintenance_cli.command('analyze')
+@click.option('--full', is_flag=True, help='ANALYZE всех таблиц вместо PRAGMA optimize.')
+@click.option('--limit', 'analysis_limit', type=int, default=None,
+              help='Строк на индекс при анализе (по умолчанию MAINTENANCE_ANALYSIS_LIMIT, 0 - без ограничения).')
+def analyze_command(full, analysis_limit):
+    """Обновляет статистику планировщика запросов."""
+    if analysis_limit is None:
+        analysis_limit = current_app.config['MAINTENANCE_ANALYSIS_LIMIT']
+    if not _is_sqlite():
+        _autocommit(['ANALYZE'])
+    elif full:
+        _autocommit([f'PRAGMA analysis_limit={int(analysis_limit)}', 'ANALYZE'])
+    else:
+        optimize(analysis_limit)
+    click.echo('Статистика обновлена.')
+
+
+@maintenance_cli.command('check')
+@click.option('--max-errors', default=100, show_default=True)
+def check_command(max_errors):
+    """Проверяет ссылочную целостность таблиц связей и файл БД (код возврата 1 при ошибках)."""
+    problems = check_integrity(max_errors)
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        raise click.ClickException(f'Найдено проблем: {len(problems)}. '
+                                   f'Строки связей без родителя удаляет `flask maintenance gc`.')
+    click.echo('Проблем не найдено.')
+
+
+@maintenance_cli.command('sizes')
+def sizes_command():
+    """Показывает число строк и размер таблиц и индексов."""
+    rows = object_sizes()
+    rows.sort(key=lambda row: row[3] or 0, reverse=True)
+    click.echo(f'{"объект":<40} {"тип":<6} {"строк":>10} {"КБ":>10}')
+    for name, kind, count, size in rows:
+        count = '' if count is None else count
+        size = '' if size is None else f'{size / 1024:.1f}'
+        click.echo(f'{name:<40} {kind:<6} {count:>10} {size:>10}')
+
+
+@maintenance_cli.command('run')
+def run_command():
+    """Выполняет легкие задачи планового обслуживания (то же, что фоновый планировщик)."""
+    summary = run_maintenance()
+    click.echo(', '.join(f'{name}: {value}' for name, value in summary.items()))
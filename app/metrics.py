@@ -0,0 +1,357 @@
+# app/metrics.py
+"""Метрики приложения в текстовом формате Prometheus (`GET /metrics`).
+
+Счетчики и гистограммы (запросы и их длительность по endpoint, запросы к БД,
+попадания в кэши) накапливаются в хранилище, подключаемом так же, как ведра
+rate limit: в памяти процесса или в общем файле SQLite. Во втором случае
+каждый воркер копит приращения в памяти и раз в METRICS_FLUSH_INTERVAL
+секунд прибавляет их к общему файлу одной транзакцией, а /metrics отдает
+сумму по всем процессам.
+
+Значения, которые дешевле посчитать в момент опроса (пул соединений,
+число заметок и объем текста по пользователям), собираются при экспорте.
+"""
+import hmac
+import ipaddress
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine
+
+# Границы гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+# --- Хранилища значений ---
+# Все значения аддитивны (счетчики, корзины гистограмм, сумма и число наблюдений),
+# поэтому значения нескольких процессов просто складываются.
+
+class MemoryStore:
+    """Значения в памяти процесса (каждый воркер отдает только свои)."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, key, amount=1):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def inc_many(self, items):
+        with self._lock:
+            for key, amount in items:
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def drain(self):
+        """Забирает накопленные значения, обнуляя хранилище."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+
+class SQLiteStore:
+    """Значения в отдельном файле SQLite, общие для всех процессов на машине.
+
+    Приращения буферизуются в памяти и сбрасываются в файл не чаще раза в
+    flush_interval секунд, чтобы запрос не платил за запись на диск.
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._buffer = MemoryStore()
+        self._last_flush = time.monotonic()
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS samples '
+                         '(name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, '
+                         'PRIMARY KEY (name, labels))')
+            self._local.conn = conn
+        return conn
+
+    def inc(self, key, amount=1):
+        self._buffer.inc(key, amount)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def inc_many(self, items):
+        self._buffer.inc_many(items)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        values = self._buffer.drain()
+        if not values:
+            return
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO samples (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                [(name, _encode_labels(labels), value) for (name, labels), value in values.items()]
+            )
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            self._buffer.inc_many(values.items()) # Не теряем приращения, попробуем в следующий раз
+            current_app.logger.error(f"Ошибка записи метрик в {self.path}: {e}")
+
+    def snapshot(self):
+        self.flush()
+        rows = self._connection().execute('SELECT name, labels, value FROM samples').fetchall()
+        return {(name, _decode_labels(labels)): value for name, labels, value in rows}
+
+
+def _encode_labels(labels):
+    return '\x1f'.join(f'{name}\x1e{value}' for name, value in labels)
+
+
+def _decode_labels(text):
+    return tuple(tuple(pair.split('\x1e', 1)) for pair in text.split('\x1f')) if text else ()
+
+
+def create_store(url, flush_interval=1.0):
+    """'memory://' или 'sqlite:///path/to/metrics.db'."""
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):], flush_interval)
+    if url.startswith('memory://'):
+        return MemoryStore()
+    raise ValueError(f"Неизвестное хранилище для метрик: {url}")
+
+
+# --- Типы метрик ---
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, name, values, extra=()):
+        return name, tuple(zip(self.labels, (str(value) for value in values))) + extra
+
+    def inc(self, *values, amount=1):
+        store = self.registry.store
+        if store is not None:
+            store.inc(self._key(self.name, values), amount)
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+        self._bounds = tuple(str(bound) for bound in self.buckets) + ('+Inf',)
+
+    def observe(self, value, *values):
+        store = self.registry.store
+        if store is None:
+            return
+        bound = self._bounds[bisect_left(self.buckets, value)]
+        store.inc_many((
+            (self._key(f'{self.name}_bucket', values, (('le', bound),)), 1),
+            (self._key(f'{self.name}_sum', values), value),
+            (self._key(f'{self.name}_count', values), 1),
+        ))
+
+
+# --- Экспорт в текстовый формат ---
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{key}="{_escape(str(val))}"' for key, val in labels) + '}'
+    if isinstance(value, float) and value.is_integer():
+        value = int(value) # Счетчики из SQLite приходят как REAL
+    return f'{name} {value}'
+
+
+def _histogram_lines(metric, values):
+    """Корзины хранятся по отдельности; в экспорте они накопительные (le - верхняя граница)."""
+    series = {}
+    for (name, labels), value in values.items():
+        if name == f'{metric.name}_bucket':
+            le = dict(labels)['le']
+            base = tuple(pair for pair in labels if pair[0] != 'le')
+            series.setdefault(base, {})[le] = value
+    lines = []
+    for base, buckets in sorted(series.items()):
+        total = 0
+        for bound in metric._bounds:
+            total += buckets.get(bound, 0)
+            lines.append(_sample(f'{metric.name}_bucket', base + (('le', bound),), total))
+        lines.append(_sample(f'{metric.name}_sum', base, values.get((f'{metric.name}_sum', base), 0)))
+        lines.append(_sample(f'{metric.name}_count', base, values.get((f'{metric.name}_count', base), 0)))
+    return lines
+
+
+def _gauges():
+    """Метрики, считаемые в момент опроса: [(имя, справка, [(метки, значение)])]."""
+    from app import db
+    from app.models import Attachment, Note
+
+    gauges = []
+    pool = db.engine.pool
+    if hasattr(pool, 'checkedout'): # У пулов SQLite/StaticPool счетчиков может не быть
+        gauges.append(('db_pool_checked_out', 'Соединения, выданные из пула (этот процесс).',
+                       [((), pool.checkedout())]))
+        gauges.append(('db_pool_size', 'Размер пула соединений (этот процесс).', [((), pool.size())]))
+
+    limit = current_app.config['METRICS_USER_LIMIT']
+    rows = db.session.execute(
+        select(Note.user_id, func.count(Note.id), func.coalesce(func.sum(Note.content_size), 0))
+        .group_by(Note.user_id)
+        .order_by(func.sum(Note.content_size).desc())
+        .limit(limit)
+    ).all()
+    attachment_bytes = dict(db.session.execute(
+        select(Attachment.user_id, func.sum(Attachment.size))
+        .where(Attachment.user_id.in_([user_id for user_id, _, _ in rows]))
+        .group_by(Attachment.user_id)
+    ).all())
+    gauges.append(('user_notes', 'Число заметок пользователя.',
+                   [((('user_id', user_id),), count) for user_id, count, _ in rows]))
+    gauges.append(('user_content_bytes', 'Объем текста заметок пользователя, байт.',
+                   [((('user_id', user_id),), size) for user_id, _, size in rows]))
+    gauges.append(('user_attachment_bytes', 'Объем вложений, загруженных пользователем, байт.',
+                   [((('user_id', user_id),), attachment_bytes.get(user_id, 0)) for user_id, _, _ in rows]))
+    return gauges
+
+
+# --- Расширение ---
+
+class Metrics:
+    def __init__(self, app=None):
+        self.store = None
+        self._metrics = []
+        self.requests = self.counter('http_requests_total', 'HTTP-запросы.', ('endpoint', 'method', 'status'))
+        self.request_duration = self.histogram('http_request_duration_seconds',
+                                               'Длительность обработки запроса.', ('endpoint',))
+        self.request_queries = self.histogram('http_request_db_queries', 'Число запросов к БД на HTTP-запрос.',
+                                              ('endpoint',), buckets=(1, 2, 5, 10, 20, 50, 100))
+        self.db_queries = self.histogram('db_query_duration_seconds', 'Длительность запросов к БД.',
+                                         (), buckets=DB_BUCKETS)
+        self.db_checkouts = self.counter('db_pool_checkouts_total', 'Выдачи соединений из пула.')
+        self.cache = self.counter('cache_requests_total', 'Обращения к кэшам.', ('cache', 'result'))
+        if app is not None:
+            self.init_app(app)
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(self, name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(self, name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_STORAGE_URL', 'memory://')
+        app.config.setdefault('METRICS_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.config.setdefault('METRICS_ALLOW_LOCAL', False)
+        app.config.setdefault('METRICS_USER_LIMIT', 100)
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+        self.store = create_store(app.config['METRICS_STORAGE_URL'], app.config['METRICS_FLUSH_INTERVAL'])
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        # На класс Engine, а не на db.engine: движок создается при первом обращении к БД, а не в create_app
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'checkout', self._checkout)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Время начала - в контексте выполнения: при ошибке запроса он просто отбрасывается
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        if start is not None:
+            self.db_queries.observe(time.perf_counter() - start)
+        if has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries += 1
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.db_checkouts.inc()
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+
+    def _after_request(self, response):
+        if 'metrics_start' not in g or request.endpoint == 'metrics':
+            return response
+        endpoint = request.endpoint or 'unmatched' # 404 без маршрута - не плодим метки по путям
+        self.requests.inc(endpoint, request.method, response.status_code)
+        self.request_duration.observe(time.perf_counter() - g.metrics_start, endpoint)
+        self.request_queries.observe(g.metrics_queries, endpoint)
+        return response
+
+    def _authorized(self):
+        token = current_app.config['METRICS_TOKEN']
+        if token:
+            # Сравнение за постоянное время: по времени ответа нельзя подбирать токен посимвольно
+            provided = request.headers.get('Authorization') or ''
+            return hmac.compare_digest(provided.encode(), f'Bearer {token}'.encode())
+        # Без токена метрики (в них есть данные по пользователям) отдаются только локально и только
+        # по явному разрешению: за прокси без PROXY_FIX_HOPS "локальны" все запросы
+        if not current_app.config['METRICS_ALLOW_LOCAL']:
+            return False
+        try:
+            return ipaddress.ip_address(request.remote_addr or '').is_loopback
+        except ValueError:
+            return False
+
+    def render(self):
+        values = self.store.snapshot()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            if metric.kind == 'histogram':
+                lines.extend(_histogram_lines(metric, values))
+            else:
+                lines.extend(_sample(name, labels, value)
+                             for (name, labels), value in sorted(values.items()) if name == metric.name)
+        for name, help, samples in _gauges():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(_sample(name, labels, value) for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+    def export(self):
+        if not self._authorized():
+            abort(403)
+        return Response(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,18 +1,31 @@
 # app/models.py
-import uuid
 from datetime import datetime, timezone
 # Убедитесь, что Table, Column, Integer, ForeignKey импортированы из sqlalchemy
-from sqlalchemy import Table, Column, Integer, ForeignKey
+from sqlalchemy import Table, Column, Integer, ForeignKey, event, update
 from app import db, login_manager
+from app.slugs import SLUG_MAX_LENGTH, assign_slug
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
 # --- Ассоциативная таблица для связи Пользователь <-> Заметка (Соавторы) ---
 note_collaborators = db.Table('note_collaborators',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
-    db.Column('note_id', db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True)
+    db.Column('note_id', db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True),
     # ondelete='CASCADE' означает, что если удаляется пользователь или заметка,
     # соответствующая запись в этой таблице тоже удалится.
+    # Обратный индекс: "кто соавторы заметки" (первичный ключ покрывает только user_id -> note_id)
+    db.Index('ix_note_collaborators_note_user', 'note_id', 'user_id')
+)
+
+# --- Проекция доступа: все заметки, доступные пользователю (свои + общие) ---
+# Одна строка на пару (пользователь, заметка), is_owner отличает автора от соавтора.
+# Списки "мои заметки" читают эту таблицу диапазоном по первичному ключу вместо
+# OR между Note.user_id и EXISTS по note_collaborators. Синхронизируется в app/access.py.
+note_access = db.Table('note_access',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('note_id', db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('is_owner', db.Boolean, nullable=False, default=False),
+    db.Index('ix_note_access_note_user', 'note_id', 'user_id')
 )
 
 # --- Таблица Тегов (если еще нет, но нужна для полноты) ---
@@ -21,6 +34,17 @@ note_tags = db.Table('note_tags',
     db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
 )
 
+# --- Связи между заметками ([[wiki-ссылки]]) ---
+# Строка на каждую ссылку source -> target_title. target_id заполняется, когда у автора
+# исходной заметки есть заметка с таким заголовком; иначе NULL (ссылка "висит" и
+# разрешится, когда такая заметка появится). Обратные ссылки - поиск по индексу target_id.
+note_links = db.Table('note_links',
+    db.Column('source_id', db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('target_title', db.String(120), primary_key=True),
+    db.Column('target_id', db.Integer, db.ForeignKey('note.id', ondelete='SET NULL'), nullable=True, index=True),
+    db.Index('ix_note_links_title', 'target_title')
+)
+
 # --- Модель User (добавляем связь с коллаборациями) ---
 @login_manager.user_loader
 def load_user(user_id):
@@ -31,6 +55,9 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), index=True, unique=True, nullable=False)
     email = db.Column(db.String(120), index=True, unique=True, nullable=False)
     password_hash = db.Column(db.String(256)) # Увеличил длину
+    # Имя в нижнем регистре (str.lower, одинаково для любой БД) для поиска без учета регистра:
+    # точное совпадение и диапазон префикса по индексу вместо ILIKE по всей таблице
+    username_lower = db.Column(db.String(64), index=True)
 
     # Связь с заметками, где пользователь автор (переименовано для ясности)
     notes_authored = db.relationship(
@@ -38,19 +65,21 @@ class User(UserMixin, db.Model):
         back_populates='author',
         lazy='dynamic',
         foreign_keys='Note.user_id', # Явно указываем foreign key
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True # Удаление выполняет БД (ondelete='CASCADE'), ORM не грузит заметки
     )
     # Связь с блокнотами пользователя
     notebooks = db.relationship(
         'Notebook', back_populates='user', lazy='dynamic',
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan", passive_deletes=True
     )
     # >>> НОВАЯ СВЯЗЬ: Заметки, где пользователь является соавтором <<<
     notes_collaborating = db.relationship(
         'Note',
         secondary=note_collaborators, # Через ассоциативную таблицу
         back_populates='collaborators', # Связь с полем collaborators в Note
-        lazy='dynamic' # Загружать по запросу
+        lazy='dynamic', # Загружать по запросу
+        passive_deletes=True
     )
 
     def set_password(self, password):
@@ -66,10 +95,22 @@ class User(UserMixin, db.Model):
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), index=True, unique=True, nullable=False)
+    # Когда тег последний раз выбирали для заметки: недавно использованные теги
+    # без заметок сборщик мусора не удаляет (см. gc_orphan_tags в app/maintenance.py)
+    last_used_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     notes = db.relationship(
         'Note', secondary=note_tags,
-        back_populates='tags', lazy='dynamic'
+        back_populates='tags', lazy='dynamic', passive_deletes=True
     )
+
+    @classmethod
+    def mark_used(cls, names):
+        """Отмечает теги использованными. Вызывается до поиска их id: в той же
+        транзакции, что и привязка к заметке, так что сборщик мусора не удалит
+        найденный тег до вставки строки note_tags."""
+        db.session.execute(update(cls).where(cls.name.in_(names)).values(last_used_at=datetime.now(timezone.utc)),
+                           execution_options={'synchronize_session': False})
+
     def __repr__(self): return f'<Tag {self.name}>'
 
 # --- Модель Notebook (если еще нет) ---
@@ -85,9 +126,17 @@ class Notebook(db.Model):
 
 # --- Модель Note (добавляем связь с соавторами) ---
 class Note(db.Model):
+    __table_args__ = (
+        # Заметки автора в порядке обновления - одним диапазоном по индексу
+        db.Index('ix_note_user_updated', 'user_id', 'updated_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(120), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
+    # Размер content в байтах UTF-8 и признак хранения по разделам (см. app/sections.py)
+    content_size = db.Column(db.Integer, nullable=False, default=0)
+    is_chunked = db.Column(db.Boolean, nullable=False, default=False)
     created_at = db.Column(db.DateTime, index=True, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, index=True, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
 
@@ -103,7 +152,7 @@ class Note(db.Model):
     tags = db.relationship(
         'Tag', secondary=note_tags,
         back_populates='notes', lazy='dynamic',
-        cascade="all, delete"
+        passive_deletes=True # Строки note_tags удаляет БД; сами теги общие и не удаляются
     )
 
     # >>> НОВАЯ СВЯЗЬ: Соавторы этой заметки <<<
@@ -111,20 +160,80 @@ class Note(db.Model):
         'User',
         secondary=note_collaborators, # Через ассоциативную таблицу
         back_populates='notes_collaborating', # Связь с полем notes_collaborating в User
-        lazy='dynamic' # Загружать по запросу
+        lazy='dynamic', # Загружать по запросу
+        passive_deletes=True
     )
 
     # Поля для публикации (оставим пока, не мешают)
     is_public = db.Column(db.Boolean, default=False, index=True)
-    public_slug = db.Column(db.String(36), unique=True, index=True, nullable=True)
+    # Уникальный индекс - единственная проверка уникальности slug'а (см. app/slugs.py)
+    public_slug = db.Column(db.String(SLUG_MAX_LENGTH), unique=True, index=True, nullable=True)
+
+    # Разделы большой заметки по заголовкам (только при is_chunked)
+    sections = db.relationship(
+        'NoteSection', lazy='dynamic', order_by='NoteSection.position',
+        cascade="all, delete-orphan", passive_deletes=True
+    )
+
+    # Вложения (файлы лежат в app/attachments/storage.py, здесь только ссылки)
+    attachments = db.relationship(
+        'Attachment', back_populates='note', lazy='dynamic',
+        cascade="all, delete-orphan", passive_deletes=True
+    )
 
     def generate_slug(self):
-        if not self.public_slug:
-            while True:
-                slug = uuid.uuid4().hex
-                if not Note.query.filter_by(public_slug=slug).first():
-                    self.public_slug = slug
-                    break
+        return assign_slug(self)
 
     def __repr__(self):
-        return f'<Note {self.title}>'
\ No newline at end of file
+        return f'<Note {self.title}>'
+
+
+# --- Модель NoteSection: раздел большой заметки (оглавление + содержимое) ---
+class NoteSection(db.Model):
+    __tablename__ = 'note_section'
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    level = db.Column(db.Integer, nullable=False, default=0) # 0 - текст до первого заголовка
+    heading = db.Column(db.String(255), nullable=True)
+    content = db.Column(db.Text, nullable=False)
+    def __repr__(self): return f'<NoteSection {self.note_id}:{self.position}>'
+
+
+# --- Модель Attachment: ссылка заметки на файл в хранилище по SHA-256 ---
+class Attachment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    note_id = db.Column(db.Integer, db.ForeignKey('note.id', ondelete='CASCADE'), nullable=False, index=True)
+    # Кто загрузил; при удалении аккаунта вложение остается в заметке (в том числе чужой)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True, index=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True) # Один файл на диске на все ссылки
+    filename = db.Column(db.String(255), nullable=False)
+    mimetype = db.Column(db.String(127), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    note = db.relationship('Note', back_populates='attachments')
+    def __repr__(self): return f'<Attachment {self.filename}>'
+
+
+# --- Нормализованное имя обновляется при каждом присваивании User.username ---
+def normalize_username(username):
+    """Ключ сравнения имен без учета регистра (User.username_lower)."""
+    return username.strip().lower() if username else None
+
+
+@event.listens_for(User.username, 'set')
+def _track_username_lower(user, value, oldvalue, initiator):
+    user.username_lower = normalize_username(value)
+
+
+# --- Размер содержимого обновляется при каждом присваивании Note.content ---
+@event.listens_for(Note.content, 'set')
+def _track_content_size(note, value, oldvalue, initiator):
+    note.content_size = len(value.encode('utf-8')) if value else 0
+
+
+# --- Синхронизация проекции доступа при создании заметок через ORM ---
+# Удаление синхронизирует БД (ondelete='CASCADE'), массовые операции (app/bulk.py)
+# обновляют note_access сами.
+@event.listens_for(Note, 'after_insert')
+def _grant_owner_access(mapper, connection, note):
+    connection.execute(note_access.insert().values(user_id=note.user_id, note_id=note.id, is_owner=True))
@@ -0,0 +1,268 @@
+# app/ratelimit.py
+"""Ограничение частоты запросов (token bucket) и admission control.
+
+Ведро на ключ (IP, пользователь, имя пользователя из формы входа) пополняется
+равномерно со скоростью limit/period и вмещает не более burst токенов. Запрос
+тратит cost токенов (по умолчанию 1, импорт - пропорционально размеру файла).
+Хранилище ведер подключаемое: в памяти процесса, в отдельном файле SQLite,
+общем для нескольких воркеров на одной машине, или в общем хранилище
+app.shared для нескольких машин.
+
+Дорогие маршруты (хэширование паролей, импорт) дополнительно ограничены
+числом одновременно выполняемых запросов: на процесс, а если общее
+хранилище app.shared не в памяти процесса - на все воркеры сразу.
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+EXPENSIVE_SLOT_TTL = 300 # Слот дорогого запроса упавшего воркера освобождается через это время
+
+
+def parse_rate(rate):
+    """'10/minute' -> (10, 60)."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period.strip()]
+
+
+def _take(tokens, updated, now, cost, rate, capacity):
+    """Пополняет ведро и пытается списать cost. Возвращает (tokens, retry_after)."""
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, (cost - tokens) / rate
+
+
+# --- Хранилища ведер ---
+
+class MemoryStore:
+    """Ведра в памяти процесса (каждый воркер считает отдельно).
+
+    Как и в SQLiteStore, у ведра хранится момент, когда оно пополнится до
+    полного (full_at): у разных лимитов разная скорость пополнения, поэтому
+    решать, можно ли удалить ведро, нужно по его собственному лимиту.
+    """
+
+    max_keys = 10000  # После этого полные (давно не использованные) ведра вычищаются
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, cost, rate, capacity):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens, retry_after = _take(tokens, updated, now, cost, rate, capacity)
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return retry_after
+
+    def _prune(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+
+
+class SQLiteStore:
+    """Ведра в отдельном файле SQLite - общие для всех процессов на машине.
+
+    Отдельный файл, а не основная БД, чтобы учет запросов не конкурировал
+    за блокировку записи с заметками. Для каждого ведра хранится момент, когда
+    оно пополнится до полного (full_at): такие ведра ничего не ограничивают и
+    удаляются prune() - из `flask maintenance run` и примерно раз в
+    prune_every запросов.
+    """
+
+    prune_every = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                         'updated REAL NOT NULL, full_at REAL NOT NULL DEFAULT 0)')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(buckets)')}
+            if 'full_at' not in columns: # Файл от прежней версии: его ведра можно сразу удалять
+                conn.execute('ALTER TABLE buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_buckets_full_at ON buckets (full_at)')
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key, cost, rate, capacity):
+        conn = self._connection()
+        now = time.time() # Часы, общие для процессов
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, retry_after = _take(tokens, updated, now, cost, rate, capacity)
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                         (key, tokens, now, now + (capacity - tokens) / rate))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if random.random() < 1 / self.prune_every:
+            self.prune()
+        return retry_after
+
+    def prune(self):
+        """Удаляет полные ведра: отсутствующее ведро и так считается полным."""
+        self._connection().execute('DELETE FROM buckets WHERE full_at <= ?', (time.time(),))
+
+
+class SharedStore:
+    """Ведра в общем хранилище app.shared (SHARED_STATE_URL) - например, в Redis,
+    чтобы лимит действовал на все машины развертывания."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def consume(self, key, cost, rate, capacity):
+        now = time.time()
+
+        def take(bucket):
+            tokens, updated = bucket if bucket else (capacity, now)
+            tokens, retry_after = _take(tokens, updated, now, cost, rate, capacity)
+            return [tokens, now], retry_after
+
+        # Полное ведро пополняется за capacity / rate секунд - дольше хранить незачем
+        return self.state.update(f'ratelimit:{key}', take, ttl=capacity / rate + 1)
+
+
+def create_store(url):
+    """'memory://', 'sqlite:///path/to/ratelimit.db' или 'shared://' (хранилище app.shared)."""
+    if url.startswith('shared://'):
+        from app import shared
+        return SharedStore(shared)
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    if url.startswith('memory://'):
+        return MemoryStore()
+    raise ValueError(f"Неизвестное хранилище для rate limit: {url}")
+
+
+# --- Ключи ведер ---
+
+def by_ip():
+    return f'ip:{request.remote_addr}'
+
+
+def by_user():
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return None # Для анонимов ограничение по пользователю не применяется
+
+
+def by_form_field(name):
+    """Ключ по значению поля формы (например, логин при подборе пароля)."""
+    def key():
+        value = request.form.get(name, '').strip().lower()
+        return f'{name}:{value}' if value else None
+    return key
+
+
+def cost_by_size(unit=1024 * 1024):
+    """Стоимость запроса: 1 токен + 1 за каждую начатую единицу размера тела."""
+    def cost():
+        return 1 + (request.content_length or 0) // unit
+    return cost
+
+
+# --- Расширение ---
+
+class RateLimiter:
+    def __init__(self, app=None):
+        self.store = None
+        self._expensive = None
+        self._shared = None # app.shared, если слоты дорогих запросов общие для воркеров
+        self._concurrency = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URL', 'memory://')
+        app.config.setdefault('RATELIMIT_EXPENSIVE_CONCURRENCY', 4)
+        self.store = create_store(app.config['RATELIMIT_STORAGE_URL'])
+        self._concurrency = app.config['RATELIMIT_EXPENSIVE_CONCURRENCY']
+        self._expensive = threading.BoundedSemaphore(self._concurrency)
+        from app import shared
+        from app.shared import MemoryBackend
+        # Общее хранилище настроено - лимит одновременных дорогих запросов общий для всех воркеров
+        self._shared = shared if shared.backend is not None and not isinstance(shared.backend, MemoryBackend) else None
+        app.extensions['ratelimit'] = self
+
+    def check(self, scope, rate, keys, burst=None, cost=1):
+        """Списывает токены со всех ведер; при нехватке - 429 с Retry-After."""
+        limit, period = parse_rate(rate)
+        capacity = burst or limit
+        amount = min(cost() if callable(cost) else cost, capacity) # Дороже полного ведра не бывает
+        for key_func in keys:
+            key = key_func()
+            if key is None:
+                continue
+            retry_after = self.store.consume(f'{scope}:{key}', amount, limit / period, capacity)
+            if retry_after:
+                current_app.logger.warning(f"Rate limit {scope} для {key}: повтор через {retry_after:.1f} с")
+                raise TooManyRequests(retry_after=max(1, int(retry_after + 0.999)))
+
+    def limit(self, rate, keys=(by_ip,), burst=None, cost=1, methods=('POST',)):
+        """Декоратор маршрута: rate вида '10/minute', keys - функции ключей ведер."""
+        def decorator(view):
+            scope = view.__name__
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if current_app.config['RATELIMIT_ENABLED'] and request.method in methods:
+                    self.check(scope, rate, keys, burst=burst, cost=cost)
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
+
+    @contextmanager
+    def _expensive_slot(self):
+        """Занимает слот дорогого запроса, если есть свободный; возвращает True/False.
+
+        С общим хранилищем слоты - это N блокировок app.shared, общих для всех
+        воркеров; иначе - семафор процесса.
+        """
+        if self._shared is None:
+            acquired = self._expensive.acquire(blocking=False)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    self._expensive.release()
+            return
+        for slot in range(self._concurrency):
+            with self._shared.lock(f'ratelimit:expensive:{slot}', ttl=EXPENSIVE_SLOT_TTL) as acquired:
+                if acquired:
+                    yield True
+                    return
+        yield False
+
+    def expensive(self, view):
+        """Декоратор дорогого маршрута: не больше N одновременных запросов (см. _expensive_slot)."""
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if not current_app.config['RATELIMIT_ENABLED'] or request.method != 'POST':
+                return view(*args, **kwargs)
+            with self._expensive_slot() as acquired:
+                if not acquired:
+                    raise TooManyRequests(retry_after=1)
+                return view(*args, **kwargs)
+        return wrapped
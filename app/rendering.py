@@ -0,0 +1,66 @@
+# app/rendering.py
+"""Рендеринг Markdown заметок.
+
+Модуль markdown и его расширения импортируются при первом рендере, а не при
+старте приложения. Экземпляр Markdown создается один раз на поток и
+переиспользуется (reset() между документами), чтобы не загружать расширения
+на каждый запрос.
+"""
+import threading
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'extra']
+# [[Заголовок]] или [[Заголовок|текст]] (используется и в app/links.py)
+WIKILINK_PATTERN = r'\[\[([^\[\]|\n]+)(?:\|([^\[\]\n]+))?\]\]'
+WIKILINK_TITLE_MAX_LENGTH = 120 # = длина Note.title
+
+_local = threading.local()
+
+
+def wikilink_title(raw):
+    """Заголовок цели ссылки в том виде, в каком он хранится в note_links."""
+    return raw.strip()[:WIKILINK_TITLE_MAX_LENGTH]
+
+
+def _wikilink_extension():
+    """Расширение [[Заголовок]] / [[Заголовок|текст]]: ссылки берутся из md.wikilinks."""
+    import xml.etree.ElementTree as etree
+    from markdown.extensions import Extension
+    from markdown.inlinepatterns import InlineProcessor
+
+    class WikiLinkProcessor(InlineProcessor):
+        def handleMatch(self, m, data):
+            title = wikilink_title(m.group(1))
+            url = self.md.wikilinks.get(title)
+            if url:
+                el = etree.Element('a', {'href': url, 'class': 'wikilink'})
+            else:
+                el = etree.Element('span', {'class': 'wikilink-missing', 'title': 'Заметка не найдена'})
+            el.text = (m.group(2) or title).strip()
+            return el, m.start(0), m.end(0)
+
+    class WikiLinkExtension(Extension):
+        def extendMarkdown(self, md):
+            md.wikilinks = {}
+            # Приоритет выше обычных ссылок, но ниже `кода`: внутри кода ссылок нет
+            md.inlinePatterns.register(WikiLinkProcessor(WIKILINK_PATTERN, md), 'wikilink', 175)
+
+    return WikiLinkExtension()
+
+
+def _markdown():
+    md = getattr(_local, 'md', None)
+    if md is None:
+        import markdown # Ленивый импорт: не нужен воркеру до первого рендера
+        md = _local.md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS + [_wikilink_extension()])
+    return md
+
+
+def render_markdown(text, wikilinks=None):
+    """Возвращает HTML для Markdown-текста.
+
+    wikilinks - {заголовок: url} для [[ссылок]] (см. app.links.link_map);
+    ссылки, которых нет в словаре, отображаются как ненайденные.
+    """
+    md = _markdown().reset()
+    md.wikilinks = wikilinks or {}
+    return md.convert(text)
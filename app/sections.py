@@ -0,0 +1,167 @@
+# app/sections.py
+"""Хранение больших заметок по разделам.
+
+Заметка больше NOTE_CHUNK_THRESHOLD байт дополнительно раскладывается по
+разделам (по ATX-заголовкам вне блоков кода) в таблицу note_section.
+Note.content остается полным текстом для редактирования, экспорта, поиска
+и ссылок, а просмотр берет из note_section оглавление и рендерит разделы по
+запросу. Цена - текст большой заметки хранится дважды (в note и в
+note_section): это обмен места в БД на то, что просмотр не читает и не
+рендерит мегабайты сразу.
+
+Определения ссылок ([id]: url) и сносок ([^id]: текст) действуют на весь
+документ, а раздел рендерится отдельно. Поэтому они выносятся из разделов в
+служебную строку с позицией DEFINITIONS_POSITION и подставляются в каждый
+раздел при рендере (сноски - только те, на которые раздел ссылается).
+"""
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, insert, select
+
+from app import db
+from app.models import Note, NoteSection
+
+SECTION_MAX_SIZE = 64 * 1024 # Разделы крупнее делятся по пустым строкам
+DEFINITIONS_POSITION = -1 # Служебная строка note_section с определениями ссылок и сносок
+_HEADING_RE = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t#]*$')
+_FENCE_RE = re.compile(r'^[ \t]*(```|~~~)')
+# [id]: url "title" и [^id]: текст сноски (продолжение сноски - строки с отступом)
+_DEFINITION_RE = re.compile(r'^ {0,3}\[(\^?)([^\]\n]+)\]:[ \t]*\S')
+_FOOTNOTE_REF_RE = re.compile(r'\[\^([^\]\n]+)\](?!:)')
+
+sections_cli = AppGroup('sections', help='Обслуживание разделов больших заметок.')
+
+
+def split_sections(content, max_size=SECTION_MAX_SIZE):
+    """Делит Markdown на разделы. Возвращает (список (level, heading, text), определения).
+
+    Первый раздел (level 0, без заголовка) - текст до первого заголовка.
+    Продолжения слишком длинных разделов получают heading=None. Определения
+    ссылок и сносок вне блоков кода убираются из разделов и возвращаются
+    отдельным текстом.
+    """
+    sections = []
+    definitions = []
+    level, heading, lines, size = 0, None, [], 0
+    fence = None
+    footnote = False # Внутри сноски: строки с отступом и пустые строки - ее продолжение
+    blank = [] # Пустые строки после сноски, пока неясно, продолжается ли она
+
+    def flush(next_level, next_heading):
+        nonlocal level, heading, lines, size
+        text = ''.join(lines)
+        if text.strip() or heading:
+            sections.append((level, heading, text))
+        level, heading, lines, size = next_level, next_heading, [], 0
+
+    for line in content.splitlines(keepends=True):
+        if footnote and fence is None:
+            if not line.strip():
+                blank.append(line)
+                continue
+            if line.startswith(('    ', '\t')):
+                definitions.extend(blank + [line])
+                blank = []
+                continue
+            footnote = False
+            lines.extend(blank)
+            blank = []
+        fence_match = _FENCE_RE.match(line)
+        definition_match = _DEFINITION_RE.match(line) if fence is None and not fence_match else None
+        if definition_match:
+            definitions.append(line if line.endswith('\n') else line + '\n')
+            footnote = bool(definition_match.group(1))
+            continue
+        if fence_match:
+            marker = fence_match.group(1)
+            fence = None if fence == marker else (fence or marker)
+        elif fence is None:
+            heading_match = _HEADING_RE.match(line.rstrip('\r\n'))
+            if heading_match:
+                flush(len(heading_match.group(1)), heading_match.group(2)[:255])
+            elif size > max_size and not line.strip():
+                flush(level, None) # Продолжение того же раздела
+        lines.append(line)
+        size += len(line)
+    lines.extend(blank)
+    flush(0, None)
+    return sections, ''.join(definitions)
+
+
+def _definition_blocks(definitions):
+    """[(имя сноски или None, текст)] - определения по одному, с продолжениями сносок."""
+    blocks = []
+    for line in definitions.splitlines(keepends=True):
+        match = _DEFINITION_RE.match(line)
+        if match or not blocks:
+            blocks.append([match.group(2) if match and match.group(1) else None, line])
+        else:
+            blocks[-1][1] += line
+    return blocks
+
+
+def section_text(section, definitions):
+    """Текст раздела для рендера: с определениями ссылок и нужных ему сносок."""
+    if not definitions:
+        return section.content
+    used = set(_FOOTNOTE_REF_RE.findall(section.content))
+    extra = [text for name, text in _definition_blocks(definitions) if name is None or name in used]
+    return section.content.rstrip('\n') + '\n\n' + ''.join(extra) if extra else section.content
+
+
+def sync_sections(note):
+    """Пересобирает разделы заметки после изменения текста (у заметки должен быть id)."""
+    chunked = (note.content_size or 0) >= current_app.config['NOTE_CHUNK_THRESHOLD']
+    if note.is_chunked or chunked:
+        db.session.execute(delete(NoteSection).where(NoteSection.note_id == note.id))
+    if chunked:
+        parts, definitions = split_sections(note.content)
+        rows = [{'note_id': note.id, 'position': position, 'level': level, 'heading': heading, 'content': text}
+                for position, (level, heading, text) in enumerate(parts)]
+        if definitions:
+            rows.append({'note_id': note.id, 'position': DEFINITIONS_POSITION, 'level': 0, 'heading': None,
+                         'content': definitions})
+        db.session.execute(insert(NoteSection), rows)
+    note.is_chunked = chunked
+
+
+def table_of_contents(note_id):
+    """Оглавление без содержимого разделов: [(position, level, heading)]."""
+    return db.session.execute(
+        select(NoteSection.position, NoteSection.level, NoteSection.heading)
+        .where(NoteSection.note_id == note_id, NoteSection.position >= 0)
+        .order_by(NoteSection.position)
+    ).all()
+
+
+def get_section(note_id, position):
+    return db.session.get(NoteSection, (note_id, position))
+
+
+def get_definitions(note_id):
+    """Текст определений ссылок и сносок заметки ('' - если их нет)."""
+    section = get_section(note_id, DEFINITIONS_POSITION)
+    return section.content if section else ''
+
+
+@sections_cli.command('rebuild')
+@click.option('--batch-size', default=100, show_default=True)
+def rebuild_command(batch_size):
+    """Пересчитывает размер и разделы всех заметок (после миграции или смены порога)."""
+    total = chunked = 0
+    last_id = 0
+    while True:
+        notes = Note.query.filter(Note.id > last_id).order_by(Note.id).limit(batch_size).all()
+        if not notes:
+            break
+        for note in notes:
+            note.content_size = len(note.content.encode('utf-8'))
+            sync_sections(note)
+            chunked += note.is_chunked
+        db.session.commit()
+        total += len(notes)
+        last_id = notes[-1].id
+    click.echo(f'Обработано заметок: {total}, из них по разделам: {chunked}.')
@@ -0,0 +1,329 @@
+# app/shared.py
+"""Общее состояние воркеров: кэш, серверные сессии и блокировки.
+
+Бэкенд выбирается по SHARED_STATE_URL, как хранилища rate limit:
+- 'memory://' - в памяти процесса (один воркер, разработка, тесты);
+- 'sqlite:///path' - отдельный файл SQLite, общий для воркеров одной машины;
+- 'redis://host:port/db' - сетевое хранилище для нескольких машин
+  (нужен пакет redis, он импортируется только при выборе этого бэкенда).
+
+Значения сериализуются так же, как cookie-сессия Flask (TaggedJSONSerializer),
+поэтому в кэш и сессию можно класть то же, что и в обычную сессию.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from secrets import token_urlsafe
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+_serializer = TaggedJSONSerializer()
+
+# Сессия без входа (обычно только csrf_token форм) живет недолго: анонимные
+# посетители не должны бесконечно пополнять хранилище
+ANONYMOUS_SESSION_TTL = 3600
+
+
+# --- Бэкенды ---
+# Общий интерфейс: get/set/delete, update (атомарное чтение-изменение-запись)
+# и acquire/release для блокировок с временем жизни.
+
+class MemoryBackend:
+    """Состояние в памяти процесса. Значения тоже сериализуются, чтобы не делить
+    изменяемые объекты между запросами (как и в остальных бэкендах)."""
+
+    def __init__(self):
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.RLock()
+
+    def _get(self, key, now):
+        entry = self._values.get(key)
+        if entry is None or (entry[1] is not None and entry[1] < now):
+            self._values.pop(key, None)
+            return None
+        return _serializer.loads(entry[0])
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key, time.time())
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (_serializer.dumps(value), time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def update(self, key, func, ttl=None):
+        with self._lock:
+            value, result = func(self._get(key, time.time()))
+            self.set(key, value, ttl)
+            return result
+
+    def acquire(self, name, owner, ttl):
+        now = time.time()
+        with self._lock:
+            holder = self._locks.get(name)
+            if holder and holder[0] != owner and holder[1] > now:
+                return False
+            self._locks[name] = (owner, now + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._lock:
+            if self._locks.get(name, (None,))[0] == owner:
+                del self._locks[name]
+
+
+class SQLiteBackend:
+    """Состояние в отдельном файле SQLite - общее для процессов одной машины."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _read(conn, key):
+        row = conn.execute('SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires >= ?)',
+                           (key, time.time())).fetchone()
+        return _serializer.loads(row[0]) if row else None
+
+    @staticmethod
+    def _write(conn, key, value, ttl):
+        conn.execute('INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)',
+                     (key, _serializer.dumps(value), time.time() + ttl if ttl else None))
+
+    def get(self, key):
+        return self._read(self._connection(), key)
+
+    def set(self, key, value, ttl=None):
+        self._write(self._connection(), key, value, ttl)
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def update(self, key, func, ttl=None):
+        with self._transaction() as conn:
+            value, result = func(self._read(conn, key))
+            self._write(conn, key, value, ttl)
+        return result
+
+    def acquire(self, name, owner, ttl):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM locks WHERE name = ? AND expires < ?', (name, now))
+            conn.execute('INSERT OR IGNORE INTO locks (name, owner, expires) VALUES (?, ?, ?)', (name, owner, now + ttl))
+            row = conn.execute('SELECT owner FROM locks WHERE name = ?', (name,)).fetchone()
+        return row[0] == owner
+
+    def release(self, name, owner):
+        self._connection().execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, owner))
+
+    def purge(self):
+        """Удаляет истекшие записи (вызывается из `flask maintenance run`)."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute('DELETE FROM kv WHERE expires < ?', (now,))
+        conn.execute('DELETE FROM locks WHERE expires < ?', (now,))
+
+
+class RedisBackend:
+    """Сетевое хранилище Redis (или совместимое) - общее для всех машин."""
+
+    # Снимает блокировку, только если она все еще принадлежит этому владельцу
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url, prefix='flaskexam:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError('Для SHARED_STATE_URL=redis://... установите пакет redis') from e
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._release = self.client.register_script(self._RELEASE)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return _serializer.loads(value.decode('utf-8')) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, _serializer.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def update(self, key, func, ttl=None):
+        full_key = self.prefix + key
+        outcome = {}
+
+        def transaction(pipe):
+            raw = pipe.get(full_key)
+            value, outcome['result'] = func(_serializer.loads(raw.decode('utf-8')) if raw is not None else None)
+            pipe.multi()
+            pipe.set(full_key, _serializer.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+        # WATCH/MULTI: при конкурентном изменении ключа транзакция повторяется
+        self.client.transaction(transaction, full_key)
+        return outcome['result']
+
+    def acquire(self, name, owner, ttl):
+        return bool(self.client.set(f'{self.prefix}lock:{name}', owner, nx=True, px=int(ttl * 1000)))
+
+    def release(self, name, owner):
+        self._release(keys=[f'{self.prefix}lock:{name}'], args=[owner])
+
+
+def create_backend(url):
+    """'memory://', 'sqlite:///path/to/shared.db' или 'redis://host:port/db'."""
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f"Неизвестное хранилище общего состояния: {url}")
+
+
+# --- Серверные сессии ---
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.user_id = self.get('_user_id') # Пользователь (Flask-Login) на момент открытия сессии
+
+
+class ServerSessionInterface(SessionInterface):
+    """Сессия хранится в общем бэкенде, в cookie - только случайный идентификатор.
+
+    Любой воркер на любой машине видит одну и ту же сессию, а ее содержимое
+    (например, flash-сообщения) не ограничено размером cookie. При входе и
+    выходе идентификатор меняется: известный заранее sid (фиксация сессии)
+    не становится авторизованным.
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+    def _key(self, sid):
+        return f'session:{sid}'
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.state.get(self._key(sid))
+            if data is not None:
+                return ServerSession(data, sid=sid)
+        return ServerSession(sid=token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                self.state.delete(self._key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if session.get('_user_id') != session.user_id:
+            if not session.new:
+                self.state.delete(self._key(session.sid))
+            session.sid = token_urlsafe(32)
+        if not self.should_set_cookie(app, session):
+            return
+        if '_user_id' not in session:
+            ttl = ANONYMOUS_SESSION_TTL
+        elif session.permanent:
+            ttl = app.permanent_session_lifetime.total_seconds()
+        else:
+            ttl = 24 * 3600
+        self.state.set(self._key(session.sid), dict(session), ttl=ttl)
+        response.vary.add('Cookie')
+        response.set_cookie(
+            name, session.sid, expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app)
+        )
+
+
+# --- Расширение ---
+
+class SharedState:
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SHARED_STATE_URL', 'memory://')
+        app.config.setdefault('SHARED_SESSIONS', False)
+        self.backend = create_backend(app.config['SHARED_STATE_URL'])
+        if app.config['SHARED_SESSIONS']:
+            app.session_interface = ServerSessionInterface(self)
+        app.extensions['shared'] = self
+
+    # Кэш
+    def get(self, key):
+        return self.backend.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def update(self, key, func, ttl=None):
+        """Атомарно: func(старое значение или None) -> (новое значение, результат)."""
+        return self.backend.update(key, func, ttl)
+
+    # Блокировки
+    @contextmanager
+    def lock(self, name, ttl=60, wait=0):
+        """Блокировка с временем жизни ttl, общая для всех воркеров бэкенда.
+
+        Возвращает True, если блокировка получена (за wait секунд), иначе False -
+        вызывающий код сам решает, пропустить работу или сообщить об ошибке.
+        """
+        owner = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        acquired = self.backend.acquire(name, owner, ttl)
+        while not acquired and time.monotonic() < deadline:
+            time.sleep(0.05)
+            acquired = self.backend.acquire(name, owner, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.backend.release(name, owner)
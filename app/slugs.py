@@ -0,0 +1,91 @@
+# app/slugs.py
+"""Генерация публичных slug'ов для заметок.
+
+Уникальность гарантирует уникальный индекс на Note.public_slug: вместо
+предварительной проверки SELECT'ом мы просто пишем slug и при конфликте
+(IntegrityError) повторяем попытку с новым значением.
+"""
+import secrets
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+SLUG_BYTES = 16  # 128 бит случайности -> 22 символа base64url
+SLUG_MAX_LENGTH = 32  # Старые slug'и (uuid4().hex) занимают 32 символа
+SLUG_MAX_ATTEMPTS = 5
+
+
+class SlugCollisionError(Exception):
+    """Не удалось подобрать уникальный slug за SLUG_MAX_ATTEMPTS попыток."""
+
+
+def new_slug():
+    """Возвращает компактный URL-безопасный идентификатор (22 символа)."""
+    return secrets.token_urlsafe(SLUG_BYTES)
+
+
+def assign_slug(note, attempts=SLUG_MAX_ATTEMPTS):
+    """Назначает заметке slug, если его еще нет, и возвращает его.
+
+    Запись идет внутри SAVEPOINT, поэтому конфликт уникального индекса
+    откатывает только саму попытку, а не всю транзакцию запроса.
+    """
+    if note.public_slug:
+        return note.public_slug
+    # Сбрасываем остальные изменения заранее, чтобы откат SAVEPOINT их не задел
+    db.session.flush()
+    for _ in range(attempts):
+        try:
+            with db.session.begin_nested():
+                note.public_slug = new_slug()
+        except IntegrityError:
+            continue
+        return note.public_slug
+    raise SlugCollisionError(f"Не удалось сгенерировать slug для заметки {note.id}")
+
+
+def publish_notes(note_ids, attempts=SLUG_MAX_ATTEMPTS):
+    """Публикует набор заметок одной транзакцией.
+
+    Заметкам без slug'а slug'и назначаются одним пакетным UPDATE (executemany),
+    остальным просто выставляется is_public. Возвращает число опубликованных
+    заметок. Коммит выполняет вызывающий код.
+    """
+    from app.models import Note  # Локальный импорт: models импортирует этот модуль
+
+    note_ids = list(note_ids)
+    if not note_ids:
+        return 0
+
+    rows = db.session.execute(
+        db.select(Note.id, Note.public_slug).where(Note.id.in_(note_ids), Note.is_public.isnot(True))
+    ).all()
+    if not rows:
+        return 0
+
+    with_slug = [row.id for row in rows if row.public_slug]
+    without_slug = [row.id for row in rows if not row.public_slug]
+
+    if with_slug:
+        db.session.execute(
+            update(Note).where(Note.id.in_(with_slug)).values(is_public=True),
+            execution_options={'synchronize_session': False}
+        )
+
+    if without_slug:
+        for _ in range(attempts):
+            params = [{'id': note_id, 'public_slug': new_slug(), 'is_public': True} for note_id in without_slug]
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(update(Note), params)  # ORM bulk UPDATE по первичному ключу
+            except IntegrityError:
+                continue
+            break
+        else:
+            raise SlugCollisionError(f"Не удалось сгенерировать slug'и для {len(without_slug)} заметок")
+
+    # Объекты в сессии могли устареть после пакетных UPDATE
+    db.session.expire_all()
+    return len(rows)
@@ -0,0 +1,36 @@
+// Автодополнение для полей с атрибутом data-autocomplete="URL".
+// Подсказки подставляются в <datalist>; для полей с data-multiple (теги через запятую)
+// дополняется последний элемент списка.
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input, index) {
+    const list = document.createElement('datalist');
+    list.id = 'autocomplete-list-' + index;
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+    input.after(list);
+
+    const multiple = input.hasAttribute('data-multiple');
+    let timer = null;
+    let lastQuery = null;
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            const parts = input.value.split(',');
+            const query = parts[parts.length - 1].trim();
+            if (!query || query === lastQuery) {
+                return;
+            }
+            lastQuery = query;
+            fetch(input.dataset.autocomplete + '?q=' + encodeURIComponent(query))
+                .then(function (response) { return response.ok ? response.json() : []; })
+                .then(function (items) {
+                    const head = multiple ? parts.slice(0, -1).map(function (p) { return p.trim(); }) : [];
+                    list.replaceChildren(...items.map(function (item) {
+                        const option = document.createElement('option');
+                        option.value = head.concat([item]).join(', ');
+                        return option;
+                    }));
+                });
+        }, 150); // Не запрашиваем на каждое нажатие
+    });
+});
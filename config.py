@@ -11,4 +11,52 @@ class Config:
     # Используем DATABASE_URL из .env или значение по умолчанию
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db') # База данных SQLite в корне проекта
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Для серверной БД (postgresql://, mysql://): проверка соединения перед выдачей из пула
+    # и переоткрытие старых соединений, которые сервер мог закрыть по таймауту
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True, 'pool_recycle': 1800} \
+        if not SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {}
+    # Вложения: каталог хранилища по SHA-256 и максимальный размер одного файла
+    ATTACHMENTS_DIR = os.environ.get('ATTACHMENTS_DIR') or os.path.join(basedir, 'attachments')
+    ATTACHMENT_MAX_SIZE = int(os.environ.get('ATTACHMENT_MAX_SIZE') or 20 * 1024 * 1024)
+    # Предельный размер тела запроса (импорт, вложения): больше - 413 до разбора файла.
+    # Должен быть не меньше ATTACHMENT_MAX_SIZE
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH') or 64 * 1024 * 1024)
+    # Ограничение частоты запросов: 'memory://' (на процесс), 'sqlite:///путь' (общий для воркеров)
+    # или 'shared://' (хранилище SHARED_STATE_URL, общее для нескольких машин)
+    RATELIMIT_ENABLED = (os.environ.get('RATELIMIT_ENABLED') or 'true').lower() == 'true'
+    # Число доверенных обратных прокси (nginx, балансировщик) перед приложением. Без него за прокси
+    # все клиенты приходят с одного IP и делят одно ведро rate limit. 0 - X-Forwarded-* не читаются
+    # (приложение доступно напрямую: иначе клиент подделает свой IP заголовком)
+    PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS') or 0)
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or 'memory://'
+    # Одновременных дорогих запросов (вход, импорт): на процесс, а при SHARED_STATE_URL не memory:// - всего
+    RATELIMIT_EXPENSIVE_CONCURRENCY = int(os.environ.get('RATELIMIT_EXPENSIVE_CONCURRENCY') or 4)
+    # Заметки больше этого размера (байт) дополнительно хранятся по разделам (note_section,
+    # вторая копия текста) и рендерятся лениво
+    NOTE_CHUNK_THRESHOLD = int(os.environ.get('NOTE_CHUNK_THRESHOLD') or 256 * 1024)
+    # Обслуживание БД (flask maintenance ...): интервал фонового запуска в секундах (0 - выключено),
+    # строк за транзакцию, пауза между пачками, страниц за шаг VACUUM и строк на индекс для ANALYZE
+    MAINTENANCE_INTERVAL = int(os.environ.get('MAINTENANCE_INTERVAL') or 0)
+    # Дольше этого (секунд) один запуск не держит блокировку - страховка от упавшего воркера;
+    # должно быть больше самого долгого запуска (VACUUM большой БД), иначе запуски пересекутся
+    MAINTENANCE_MAX_RUNTIME = int(os.environ.get('MAINTENANCE_MAX_RUNTIME') or 3600)
+    MAINTENANCE_BATCH_SIZE = int(os.environ.get('MAINTENANCE_BATCH_SIZE') or 500)
+    MAINTENANCE_BATCH_PAUSE = float(os.environ.get('MAINTENANCE_BATCH_PAUSE') or 0.05)
+    MAINTENANCE_VACUUM_PAGES = int(os.environ.get('MAINTENANCE_VACUUM_PAGES') or 256)
+    MAINTENANCE_ANALYSIS_LIMIT = int(os.environ.get('MAINTENANCE_ANALYSIS_LIMIT') or 1000)
+    # Теги без заметок, использованные за последние N секунд, сборщик мусора не удаляет
+    MAINTENANCE_TAG_GRACE = int(os.environ.get('MAINTENANCE_TAG_GRACE') or 600)
+    # Метрики (/metrics): 'memory://' (на процесс) или 'sqlite:///путь' (сумма по всем воркерам);
+    # без METRICS_TOKEN эндпоинт закрыт (403), если METRICS_ALLOW_LOCAL не разрешает запросы с localhost
+    # (за локальным прокси без PROXY_FIX_HOPS с localhost приходят все запросы)
+    METRICS_ENABLED = (os.environ.get('METRICS_ENABLED') or 'true').lower() == 'true'
+    METRICS_STORAGE_URL = os.environ.get('METRICS_STORAGE_URL') or 'memory://'
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL') or 1.0)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_ALLOW_LOCAL = (os.environ.get('METRICS_ALLOW_LOCAL') or 'false').lower() == 'true'
+    METRICS_USER_LIMIT = int(os.environ.get('METRICS_USER_LIMIT') or 100)
+    # Общее состояние воркеров (app/shared.py): 'memory://', 'sqlite:///путь' (одна машина)
+    # или 'redis://host:6379/0' (несколько машин); SHARED_SESSIONS - сессии на сервере, а не в cookie
+    SHARED_STATE_URL = os.environ.get('SHARED_STATE_URL') or 'memory://'
+    SHARED_SESSIONS = (os.environ.get('SHARED_SESSIONS') or 'false').lower() == 'true'
@@ -0,0 +1,44 @@
+"""Populate note_access for existing notes
+
+Проекция доступа появилась позже заметок: строки для автора и соавторов
+уже существующих заметок добавляются здесь, без ручного `flask access rebuild`.
+
+Revision ID: b3d1f0a9c2e4
+Revises: 70e8820576e9
+Create Date: 2026-10-19 18:18:41.317904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d1f0a9c2e4'
+down_revision = '70e8820576e9'
+branch_labels = None
+depends_on = None
+
+# Таблицы в том виде, в каком они есть на этой ревизии (модели приложения могут измениться)
+note = sa.table('note', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer))
+note_collaborators = sa.table('note_collaborators', sa.column('user_id', sa.Integer), sa.column('note_id', sa.Integer))
+note_access = sa.table('note_access', sa.column('user_id', sa.Integer), sa.column('note_id', sa.Integer),
+                       sa.column('is_owner', sa.Boolean))
+
+
+def _missing(user_id, note_id):
+    return ~sa.exists().where(note_access.c.user_id == user_id, note_access.c.note_id == note_id)
+
+
+def upgrade():
+    owners = sa.select(note.c.user_id, note.c.id, sa.true()).where(_missing(note.c.user_id, note.c.id))
+    op.execute(note_access.insert().from_select(['user_id', 'note_id', 'is_owner'], owners))
+    collaborators = sa.select(note_collaborators.c.user_id, note_collaborators.c.note_id, sa.false())\
+        .join(note, note.c.id == note_collaborators.c.note_id)\
+        .where(note_collaborators.c.user_id != note.c.user_id,
+               _missing(note_collaborators.c.user_id, note_collaborators.c.note_id))
+    op.execute(note_access.insert().from_select(['user_id', 'note_id', 'is_owner'], collaborators))
+
+
+def downgrade():
+    # Строки проекции удаляются вместе с таблицей при откате 70e8820576e9
+    pass
@@ -0,0 +1,49 @@
+"""Backfill user.username_lower
+
+Поиск пользователя без учета регистра (find_user, автодополнение) идет по
+username_lower; для пользователей, созданных до этой колонки, она заполняется
+здесь. Нормализация - в Python, как app.models.normalize_username: lower()
+в SQLite меняет регистр только у латиницы.
+
+Revision ID: c7e2a4d85f13
+Revises: b3d1f0a9c2e4
+Create Date: 2026-10-19 18:19:27.661385
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a4d85f13'
+down_revision = 'b3d1f0a9c2e4'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+user = sa.table('user', sa.column('id', sa.Integer), sa.column('username', sa.String),
+                sa.column('username_lower', sa.String))
+
+
+def upgrade():
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(user.c.id, user.c.username)
+            .where(user.c.username_lower.is_(None), user.c.id > last_id)
+            .order_by(user.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            user.update().where(user.c.id == sa.bindparam('user_id')).values(username_lower=sa.bindparam('lower')),
+            [{'user_id': user_id, 'lower': username.strip().lower()} for user_id, username in rows]
+        )
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    # Колонка удаляется при откате 70e8820576e9
+    pass
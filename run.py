@@ -1,21 +1,16 @@
-from app import create_app, db # Импортируем фабрику и db
-# Убедитесь, что модели импортированы *после* создания db,
-# что происходит внутри create_app или перед shell context
-from app.models import User, Note
+from app import create_app # Импортируем фабрику
+# Модели и контекст Flask Shell регистрируются внутри create_app
 
 # Создаем экземпляр приложения с помощью фабрики
 app = create_app()
 
-# Контекст для Flask Shell (удобно для отладки и работы с БД вручную)
-@app.shell_context_processor
-def make_shell_context():
-    return {'db': db, 'User': User, 'Note': Note}
-
 if __name__ == '__main__':
     # При первом запуске:
     # export FLASK_APP=run.py (или set FLASK_APP=run.py в Windows)
-    # flask db init (только один раз)
-    # flask db migrate -m "Initial migration with Note table"
-    # flask db upgrade
+    # flask db upgrade (схема из migrations/, для SQLite и для DATABASE_URL=postgresql://...)
+    # БД прежней версии (без migrations/ в репозитории) один раз отмечаем начальной ревизией
+    # и обновляем: flask db stamp 24a5c71b174b && flask db upgrade
+    # БД, созданную db.create_all() по текущим моделям, отмечаем: flask db stamp head
+    # После изменения моделей: flask db migrate -m "..." && flask db upgrade
 
     app.run(debug=True) # Запускаем сервер разработки
\ No newline at end of file